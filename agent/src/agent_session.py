@@ -0,0 +1,296 @@
+import asyncio
+import json
+import logging
+import random
+import time
+import uuid
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional
+
+import websockets
+
+from match_diff import MatchDiffer
+from spool import UpdateSpool, compact_messages
+import wire
+from models import CurrentMatch, CurrentMatchPlayer, EnhancedJSONEncoder
+
+# First reconnect delay in seconds, doubled after every failed attempt
+RECONNECT_BASE_DELAY = 1.0
+# Upper bound for the reconnect delay in seconds
+RECONNECT_MAX_DELAY = 30.0
+# Seconds to wait for the backend's answer to our hello
+RESUME_TIMEOUT = 5.0
+# Maximum number of messages sent but not acknowledged yet
+WINDOW_SIZE = 32
+# Unsent messages kept before they are compacted into one batch with the latest state per match
+MAX_PENDING = 256
+# Seconds between fsyncs of the on-disk spool
+SPOOL_SYNC_INTERVAL = 1.0
+# Seconds without ACK progress before every unacknowledged message is sent again
+ACK_TIMEOUT = 10.0
+
+
+class AgentSession:
+    """
+    Single long-lived WebSocket to the backend that carries create/update/end messages for every match.
+
+    Messages are queued and sent by a background task, numbered with a session-wide id. The backend acknowledges
+    cumulatively (every id up to N was applied), at most WINDOW_SIZE messages are in flight and only the ones that
+    were not acknowledged are sent again, so the agent loop never waits on the backend.
+    The connection is re-established with jittered exponential backoff and resumed from the last acknowledged id.
+
+    Every queued message is also journaled to an UpdateSpool, so nothing is lost while the backend is unreachable,
+    even across agent restarts. When the connection comes back the backlog is replayed as one compacted batch with
+    only the latest state per match.
+    """
+
+    def __init__(self, url: str, api_key: str, spool: Optional[UpdateSpool] = None,
+                 encodings: Optional[List[str]] = None):
+        self.url = f"{url}?api_key={api_key}"
+        self.session_id = uuid.uuid4().hex
+        self.matches: Dict[str, MatchDiffer] = {}
+        self.next_id = 1
+        # Messages not sent yet, and messages sent but not acknowledged, both oldest first
+        self.pending: Deque[dict] = deque()
+        self.unacked: Deque[dict] = deque()
+        self.last_ack_progress = time.monotonic()
+        self.wakeup = asyncio.Event()
+        self.spool = spool or UpdateSpool()
+        # Binary encodings offered in the hello, and the one the backend picked for this connection
+        self.encodings = wire.available_encodings() if encodings is None else encodings
+        self.encoding = "json"
+        self.ws = None
+        self.task: Optional[asyncio.Task] = None
+        self.sync_task: Optional[asyncio.Task] = None
+        self.logger = logging.getLogger(__name__)
+
+    def start(self):
+        if self.task is None:
+            # Replay whatever a previous run could not deliver; it is compacted into a batch when resuming
+            for message in self.spool.load():
+                self._number(message)
+                self.pending.append(message)
+            if self.pending:
+                self.logger.info(f"Replaying {len(self.pending)} spooled match states")
+            self.task = asyncio.create_task(self._run())
+            self.sync_task = asyncio.create_task(self._sync_loop())
+
+    async def close(self):
+        for task in (self.task, self.sync_task):
+            if task is not None:
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+        self.task = None
+        self.sync_task = None
+        if self.ws is not None:
+            await self.ws.close()
+        self.spool.close()
+
+    async def _sync_loop(self):
+        while True:
+            await asyncio.sleep(SPOOL_SYNC_INTERVAL)
+            await asyncio.to_thread(self.spool.sync)
+            if self.spool.full:
+                await asyncio.to_thread(self.spool.compact)
+
+    async def _run(self):
+        attempt = 0
+        while True:
+            try:
+                async with websockets.connect(self.url) as ws:
+                    self.ws = ws
+                    await self._resume(ws)
+                    attempt = 0
+                    self.logger.info("Agent session connected")
+                    tasks = [asyncio.create_task(self._send_loop(ws)), asyncio.create_task(self._receive(ws))]
+                    try:
+                        done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                        for task in done:
+                            task.result()
+                    finally:
+                        for task in tasks:
+                            task.cancel()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.logger.warning(f"Agent session connection failed: {e}")
+            finally:
+                self.ws = None
+
+            # Full jitter: wait a random time up to the exponential backoff
+            delay = random.uniform(0, min(RECONNECT_MAX_DELAY, RECONNECT_BASE_DELAY * 2 ** attempt))
+            attempt += 1
+            self.logger.info(f"Reconnecting agent session in {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+    async def _resume(self, ws):
+        """
+        Tell the backend who we are and which matches we track.
+        If it still knows this session, messages it did not acknowledge are sent again; otherwise it lost its state
+        and every match it is behind on is resent in full.
+        """
+        await ws.send(json.dumps({
+            "type": "hello",
+            "session_id": self.session_id,
+            "matches": list(self.matches),
+            "encodings": self.encodings,
+        }))
+        reply = await asyncio.wait_for(self._resume_reply(ws), timeout=RESUME_TIMEOUT)
+        self.encoding = reply.get("encoding") if reply.get("encoding") in self.encodings else "json"
+
+        acked = reply.get("ack")
+        if acked is not None:
+            self._acknowledge(acked)
+        states = {message["match_uuid"]: message for message in compact_messages([*self.unacked, *self.pending])}
+        self.unacked.clear()
+        self.pending.clear()
+
+        if acked is None:
+            # The backend lost its state: send every tracked match it is behind on in full
+            backend_seqs = reply.get("matches", {})
+            for match_uuid, differ in self.matches.items():
+                seq = backend_seqs.get(match_uuid)
+                if seq is None:
+                    states[match_uuid] = differ.create_message()
+                elif seq < differ.seq:
+                    states[match_uuid] = differ.snapshot_message()
+
+        if states:
+            self._queue_batch(list(states.values()))
+        self.logger.info(f"Resumed agent session after #{acked}, replaying {len(states)} match states")
+        self._drained()
+
+    async def _resume_reply(self, ws) -> dict:
+        while True:
+            reply = json.loads(await ws.recv())
+            if isinstance(reply, dict) and reply.get("type") == "resume":
+                return reply
+
+    async def _send_loop(self, ws):
+        while True:
+            while self.pending and len(self.unacked) < WINDOW_SIZE:
+                message = self.pending[0]
+                await ws.send(self._frame(message))
+                self.pending.popleft()
+                if not self.unacked:
+                    self.last_ack_progress = time.monotonic()
+                self.unacked.append(message)
+
+            if self.unacked and time.monotonic() - self.last_ack_progress > ACK_TIMEOUT:
+                # Go back N: the backend skips ids it already applied
+                self.logger.warning(f"No ACK for #{self.unacked[0]['id']} in {ACK_TIMEOUT}s, resending {len(self.unacked)} messages")
+                for message in self.unacked:
+                    await ws.send(self._frame(message))
+                self.last_ack_progress = time.monotonic()
+
+            self.wakeup.clear()
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), timeout=ACK_TIMEOUT)
+            except asyncio.TimeoutError:
+                pass
+
+    def _frame(self, message: dict):
+        if self.encoding == "json":
+            return json.dumps(message, cls=EnhancedJSONEncoder)
+        return wire.encode(message, self.encoding)
+
+    async def _receive(self, ws):
+        async for raw in ws:
+            try:
+                msg = wire.decode(raw) if isinstance(raw, bytes) else json.loads(raw)
+            except json.JSONDecodeError:
+                self.logger.warning(f"Received non-JSON message: {raw}")
+                continue
+            if not isinstance(msg, dict):
+                self.logger.info(f"Received message: {msg}")
+                continue
+
+            if msg.get("type") == "ack":
+                if msg.get("error"):
+                    self.logger.error(f"Backend failed to apply message #{msg['id']}")
+                self._acknowledge(msg["id"])
+            elif msg.get("type") == "request_data":
+                differ = self.matches.get(msg.get("match_uuid"))
+                if differ:
+                    self._enqueue(differ.snapshot_message())
+                    self.logger.info(f"Queued data in response to request for match {differ.match_uuid}")
+            else:
+                self.logger.info(f"Received message: {msg}")
+
+    def _acknowledge(self, acked: int):
+        progressed = False
+        while self.unacked and self.unacked[0]["id"] <= acked:
+            self.unacked.popleft()
+            progressed = True
+        if progressed:
+            self.last_ack_progress = time.monotonic()
+            self.wakeup.set()
+            self._drained()
+
+    def _drained(self):
+        # The backend applied everything that was journaled
+        if not self.unacked and not self.pending:
+            self.spool.reset()
+
+    def _number(self, message: dict):
+        message["id"] = self.next_id
+        self.next_id += 1
+
+    def _queue_batch(self, messages: List[dict]):
+        """Queue several messages as one, applied in order and acknowledged together."""
+        if len(messages) == 1:
+            batch = messages[0]
+        else:
+            batch = {"type": "batch", "messages": messages}
+        self._number(batch)
+        self.pending.append(batch)
+        self.wakeup.set()
+
+    def _enqueue(self, message: Optional[dict]) -> Optional[dict]:
+        if message is None:
+            return None
+        self._number(message)
+        self.spool.append(message)
+        self.pending.append(message)
+        if len(self.pending) > MAX_PENDING:
+            self.logger.warning(f"Backend is not keeping up, compacting {len(self.pending)} unsent messages")
+            backlog = compact_messages(list(self.pending))
+            self.pending.clear()
+            self._queue_batch(backlog)
+        self.wakeup.set()
+        return message
+
+    def create_match(self, match_data: CurrentMatch):
+        differ = MatchDiffer(match_data.match_uuid)
+        differ.diff(match_data)
+        self.matches[match_data.match_uuid] = differ
+        self._enqueue(differ.create_message())
+        self.logger.info(f"Queued creation of active match {match_data.match_uuid}")
+
+    def update_match(self, match_data: CurrentMatch) -> Optional[dict]:
+        """Queue the fields that changed since the last update; returns the patch, or None if nothing changed."""
+        differ = self.matches.get(match_data.match_uuid)
+        if differ is None:
+            return None
+        return self._enqueue(differ.patch_message(differ.diff(match_data)))
+
+    def update_fields(self, match_uuid: str, fields: Dict[str, Any]) -> Optional[dict]:
+        """Queue only the given match fields, for updates that do not come with a fresh CurrentMatch."""
+        differ = self.matches.get(match_uuid)
+        if differ is None:
+            return None
+        return self._enqueue(differ.patch_message(differ.diff_fields(fields)))
+
+    def update_player(self, match_uuid: str, player: CurrentMatchPlayer) -> Optional[dict]:
+        differ = self.matches.get(match_uuid)
+        if differ is None:
+            return None
+        changed = differ.diff_player(player)
+        return self._enqueue(differ.patch_message({"players": [changed]} if changed else {}))
+
+    def end_match(self, match_uuid: str):
+        differ = self.matches.pop(match_uuid, None)
+        if differ is None:
+            return
+        self._enqueue(differ.end_message())
+        self.logger.info(f"Queued end of active match {match_uuid}")
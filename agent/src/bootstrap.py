@@ -0,0 +1,107 @@
+import asyncio
+import logging
+import time
+from typing import Awaitable, Dict, List, Optional, Set, TypeVar
+
+from agent_session import AgentSession
+from discord_rpc import DiscordRPC
+from match import Match
+from name_service import content
+from player_stats import PlayerStats
+from pregame import Pregame
+from presence import Presence
+from presence_events import PresenceEvents
+from req import Requests
+from scheduler import PollScheduler
+from user import Users
+
+T = TypeVar("T")
+
+
+class Services:
+    """
+    Every service of the agent, built once at startup and shared.
+    create() runs the independent startup steps concurrently: the region scan of ShooterGame.log, the client
+    version and auth headers, the local chat session and loading the content store. Work the loop does not need
+    right away (our own rank, content for a new game version) runs in the background, and Discord connects on its
+    worker thread on the first presence update. Only when no agent data is stored yet is the first content refresh
+    awaited before the loop starts.
+    The duration of every step is logged, so cold start can be measured.
+    """
+
+    def __init__(self):
+        self.timings: Dict[str, float] = {}
+        self.background: Set[asyncio.Task] = set()
+        self.logger = logging.getLogger(__name__)
+
+    async def _timed(self, step: str, awaitable: Awaitable[T]) -> T:
+        started = time.perf_counter()
+        try:
+            return await awaitable
+        finally:
+            self.timings[step] = time.perf_counter() - started
+
+    def _defer(self, step: str, awaitable: Awaitable):
+        async def run():
+            try:
+                await self._timed(step, awaitable)
+                self.logger.info(f"Deferred startup step {step} finished in {self.timings[step]:.2f}s")
+            except Exception:
+                self.logger.exception(f"Deferred startup step {step} failed")
+
+        task = asyncio.create_task(run())
+        self.background.add(task)
+        task.add_done_callback(self.background.discard)
+
+    @classmethod
+    async def create(cls, session_url: str, api_key: str, enrich_concurrency: int,
+                     encodings: Optional[List[str]] = None, imports: float = 0.0) -> "Services":
+        self = cls()
+        started = time.perf_counter()
+        if imports:
+            self.timings["imports"] = imports
+
+        self.requests = await self._timed("lockfile", asyncio.to_thread(Requests))
+
+        async def auth():
+            await self._timed("version", asyncio.to_thread(self.requests.load_version))
+            await self._timed("headers", self.requests.load_headers())
+
+        _, _, self.user, _ = await asyncio.gather(
+            self._timed("region", asyncio.to_thread(self.requests.load_region)),
+            auth(),
+            self._timed("session", Users.create(self.requests)),
+            self._timed("content", asyncio.to_thread(content.load)),
+        )
+
+        if not content.agents:
+            # Nothing stored yet (first run): wait for one refresh, or every agent would show as its uuid
+            await self._timed("content_refresh", content.try_refresh(self.requests.version))
+
+        self.presence_events = PresenceEvents(self.requests)
+        self.presence = Presence(self.requests, self.presence_events)
+        self.stats = PlayerStats(self.requests)
+        self.match = Match(self.requests, self.user, enrich_concurrency=enrich_concurrency,
+                           presence=self.presence, stats=self.stats)
+        self.pregame = Pregame(self.requests, self.user)
+        self.rpc = DiscordRPC()
+        self.scheduler = PollScheduler()
+        self.agent_session = AgentSession(session_url, api_key, encodings=encodings)
+        self._defer("user_rank", self.match.load_user_rank())
+        # Only downloads anything when the game was updated since the content was stored, or agents are still missing
+        self._defer("content_update", content.keep_refreshed(self.requests.version))
+
+        total = time.perf_counter() - started
+        steps = ", ".join(f"{step} {seconds:.2f}s" for step, seconds in self.timings.items())
+        self.logger.info(f"Agent started in {total:.2f}s ({steps}; region, version+headers, session and content run concurrently)")
+        return self
+
+    async def close(self):
+        for task in list(self.background):
+            task.cancel()
+        await asyncio.gather(*self.background, return_exceptions=True)
+        await self.presence_events.close()
+        await self.agent_session.close()
+        await self.requests.close()
+        self.stats.close()
+        self.rpc.close()
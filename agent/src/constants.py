@@ -181,7 +181,8 @@ maps = {
     "/Game/Maps/Infinity/Infinity": "Abyss"
 }
 
-before_ascendant_seasons = [
+# Seasons before Ascendant was added; their tiers are shifted by 3 to line up with the current tier ids
+before_ascendant_seasons = frozenset({
     "0df5adb9-4dcb-6899-1306-3e9860661dd3",
     "3f61c772-4560-cd3f-5d3f-a7ab5abda6b3",
     "0530b9c4-4980-f2ee-df5d-09864cd00542",
@@ -199,4 +200,4 @@ before_ascendant_seasons = [
     "d929bc38-4ab6-7da4-94f0-ee84f8ac141e",
     "3e47230a-463c-a301-eb7d-67bb60357d4f",
     "808202d6-4f2b-a8ff-1feb-b3a0590ad79f",
-]
\ No newline at end of file
+})
\ No newline at end of file
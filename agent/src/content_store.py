@@ -0,0 +1,162 @@
+import asyncio
+import json
+import logging
+import os
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import requests
+
+import constants
+from storage import get_data_path
+
+CONTENT_API = "https://valorant-api.com/v1"
+# valorant-api endpoint and query parameters of every kind of content we keep
+SOURCES = {
+    "agents": ("/agents", {"isPlayableCharacter": "true", "language": "en-US"}),
+    "maps": ("/maps", {"language": "en-US"}),
+    "tiers": ("/competitivetiers", {"language": "en-US"}),
+}
+# Seconds to wait for valorant-api per request
+REQUEST_TIMEOUT = 10
+# Seconds between refresh attempts while there is no agent data at all
+RETRY_DELAY = 60
+
+
+def compact_agents(data: List[dict]) -> Dict[str, Tuple[str, str]]:
+    return {a["uuid"]: (a["displayName"], a["displayIcon"]) for a in data}
+
+
+def compact_maps(data: List[dict]) -> Dict[str, str]:
+    return {m["mapUrl"]: m["displayName"] for m in data if m.get("mapUrl")}
+
+
+def compact_tiers(data: List[dict]) -> List[Optional[dict]]:
+    """Tiers of the newest competitive tier set as a list indexed by tier id."""
+    tiers: List[Optional[dict]] = []
+    for tier in data[-1]["tiers"]:
+        index = tier["tier"]
+        tiers.extend([None] * (index + 1 - len(tiers)))
+        tiers[index] = {
+            "tierName": tier["tierName"],
+            "divisionName": tier["divisionName"],
+            "smallIcon": tier.get("smallIcon"),
+        }
+    return tiers
+
+
+COMPACTORS = {"agents": compact_agents, "maps": compact_maps, "tiers": compact_tiers}
+
+
+class ContentStore:
+    """
+    Agents, maps and competitive tiers, kept on disk in compact form and keyed by riotClientVersion.
+    Lookups only read memory, so nothing on the match hot path touches the network. Until the store was loaded, and
+    for anything valorant-api did not know, the bundled tables in constants are used for maps and tiers.
+    There is no bundled agent table: agents show as their uuid until the first successful refresh.
+    refresh() is only needed when the game version changed; it asks valorant-api with the ETag of the stored copy,
+    so content that did not change is not downloaded again.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self.version: Optional[str] = None
+        self.etags: Dict[str, str] = {}
+        self.agents: Dict[str, Tuple[str, str]] = {}
+        self.maps: Dict[str, str] = dict(constants.maps)
+        self.tiers: List[Optional[dict]] = [constants.ranks.get(i) for i in range(max(constants.ranks) + 1)]
+        self.lock = threading.Lock()
+        self.logger = logging.getLogger(__name__)
+
+    def _path(self) -> str:
+        return self.path or get_data_path("content_store.json")
+
+    def _apply(self, content: Dict[str, object]):
+        if content.get("agents"):
+            self.agents = {uuid: tuple(agent) for uuid, agent in content["agents"].items()}
+        if content.get("maps"):
+            self.maps = {**constants.maps, **content["maps"]}
+        if content.get("tiers"):
+            self.tiers = content["tiers"]
+
+    def load(self) -> Optional[str]:
+        """Load the stored content; returns the riotClientVersion it was fetched for, or None if there is none."""
+        try:
+            with open(self._path(), "r", encoding="utf-8") as f:
+                stored = json.load(f)
+        except (OSError, ValueError):
+            return None
+        self.version = stored.get("version")
+        self.etags = stored.get("etags", {})
+        self._apply(stored.get("content", {}))
+        return self.version
+
+    def refresh(self, version: str, session: Optional[requests.Session] = None):
+        """Bring the store up to date for the client version, downloading only content whose ETag changed."""
+        with self.lock:
+            if version == self.version and self.agents:
+                return
+            session = session or requests.Session()
+            try:
+                with open(self._path(), "r", encoding="utf-8") as f:
+                    content = json.load(f).get("content", {})
+            except (OSError, ValueError):
+                content = {}
+
+            etags = dict(self.etags)
+            for name, (endpoint, params) in SOURCES.items():
+                headers = {"If-None-Match": etags[name]} if name in etags and content.get(name) else {}
+                try:
+                    response = session.get(CONTENT_API + endpoint, params=params, headers=headers,
+                                           timeout=REQUEST_TIMEOUT)
+                    if response.status_code == 304:
+                        continue
+                    response.raise_for_status()
+                    content[name] = COMPACTORS[name](response.json()["data"])
+                    if response.headers.get("ETag"):
+                        etags[name] = response.headers["ETag"]
+                except (requests.RequestException, ValueError, KeyError, IndexError, TypeError) as e:
+                    # Keep what we have; the next version change retries
+                    self.logger.warning(f"Could not refresh {name} content: {e}")
+                    version = self.version
+
+            self._apply(content)
+            self.version = version
+            self.etags = etags
+            tmp_path = f"{self._path()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"version": version, "etags": etags, "content": content}, f)
+            os.replace(tmp_path, self._path())
+            self.logger.info(f"Content store up to date for {version}")
+
+    async def try_refresh(self, version: str) -> bool:
+        """Refresh once for the client version; True if agent data is available afterwards."""
+        try:
+            await asyncio.to_thread(self.refresh, version)
+        except OSError as e:
+            self.logger.warning(f"Could not store content: {e}")
+        return bool(self.agents)
+
+    async def keep_refreshed(self, version: str):
+        """Refresh for the client version, retrying every RETRY_DELAY seconds until agent data is available."""
+        while True:
+            if await self.try_refresh(version):
+                return
+            self.logger.warning(f"No agent data yet, retrying in {RETRY_DELAY}s")
+            await asyncio.sleep(RETRY_DELAY)
+
+    def agent_name(self, agent_id: str) -> str:
+        agent = self.agents.get(agent_id)
+        return agent[0] if agent else agent_id
+
+    def agent_icon(self, agent_id: str) -> str:
+        agent = self.agents.get(agent_id)
+        return agent[1] if agent else ""
+
+    def map_name(self, map_id: str) -> str:
+        return self.maps.get(map_id, map_id)
+
+    def tier(self, tier_id: int) -> Optional[dict]:
+        if 0 <= tier_id < len(self.tiers):
+            return self.tiers[tier_id]
+        return None
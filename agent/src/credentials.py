@@ -0,0 +1,174 @@
+import asyncio
+import base64
+import json
+import logging
+import os
+import re
+import threading
+import time
+from typing import Dict, Optional
+
+import requests
+
+from storage import get_data_path
+
+# Tokens are refreshed in the background this many seconds before they expire
+REFRESH_MARGIN = 5 * 60
+# Seconds before a failed background refresh is retried
+REFRESH_RETRY_DELAY = 30
+# Token lifetime assumed when the expiry cannot be decoded from the JWTs
+DEFAULT_TOKEN_LIFETIME = 55 * 60
+# Game builds whose client version is remembered on disk
+MAX_CACHED_BUILDS = 10
+# Seconds a client version looked up on valorant-api is trusted for a build; it can lag behind on patch day
+VERSION_TTL = 60 * 60
+# What a riotClientVersion looks like, e.g. release-09.11-shipping-24-3230467
+CLIENT_VERSION_PATTERN = re.compile(r"^release-\d+\.\d+-shipping-\d+-\d+$")
+
+CLIENT_PLATFORM = "ew0KCSJwbGF0Zm9ybVR5cGUiOiAiUEMiLA0KCSJwbGF0Zm9ybU9TIjogIldpbmRvd3MiLA0KCSJwbGF0Zm9ybU9TVmVyc2lvbiI6ICIxMC4wLjE5MDQyLjEuMjU2LjY0Yml0IiwNCgkicGxhdGZvcm1DaGlwc2V0IjogIlVua25vd24iDQp9"
+USER_AGENT = "ShooterGame/13 Windows/10.0.19043.1.256.64bit"
+
+
+def jwt_expiry(token: str) -> Optional[float]:
+    """Unix time of the token's exp claim, or None if it is not a readable JWT. The signature is not checked."""
+    try:
+        payload = token.split(".")[1]
+        payload += "=" * (-len(payload) % 4)
+        return float(json.loads(base64.urlsafe_b64decode(payload))["exp"])
+    except (AttributeError, IndexError, KeyError, TypeError, ValueError):
+        return None
+
+
+class CredentialManager:
+    """
+    Riot auth headers for pd / glz requests.
+    The access token and entitlement JWT from the local client are reused until their decoded expiry, and a
+    background task refreshes them REFRESH_MARGIN seconds ahead of it. The client version comes from the running
+    build as the local client reports it, falling back to valorant-api with a per-build on-disk cache.
+    Callers that hit an auth error pass the headers they used to refresh(), so however many of them fail at once,
+    the tokens are fetched only once.
+    """
+
+    def __init__(self, session: requests.Session, lockfile: dict, version_cache_path: Optional[str] = None):
+        self.session = session
+        self.lockfile = lockfile
+        self.version_cache_path = version_cache_path or get_data_path("client_versions.json")
+        self.headers: Dict[str, str] = {}
+        self.subject = ""
+        self.expires_at = 0.0
+        self.version: Optional[str] = None
+        self.lock = threading.Lock()
+        self.task: Optional[asyncio.Task] = None
+        self.logger = logging.getLogger(__name__)
+
+    @property
+    def valid(self) -> bool:
+        return bool(self.headers) and time.time() < self.expires_at
+
+    def _local(self, endpoint: str) -> dict:
+        auth = {"Authorization": "Basic " + base64.b64encode(("riot:" + self.lockfile["password"]).encode()).decode()}
+        response = self.session.get(f"https://127.0.0.1:{self.lockfile['port']}{endpoint}", headers=auth,
+                                    verify=False, timeout=5)
+        response.raise_for_status()
+        return response.json()
+
+    def _game_build(self) -> Optional[str]:
+        """Build of the running game as reported by the local client, or None if it is unknown."""
+        try:
+            sessions = self._local("/product-session/v1/external-sessions")
+        except (requests.RequestException, ValueError):
+            return None
+        for product_session in (sessions or {}).values():
+            if product_session.get("productId") == "valorant" and product_session.get("version"):
+                return product_session["version"]
+        return None
+
+    def _read_versions(self) -> Dict[str, dict]:
+        try:
+            with open(self.version_cache_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _write_versions(self, versions: Dict[str, dict]):
+        try:
+            tmp_path = f"{self.version_cache_path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(versions, f)
+            os.replace(tmp_path, self.version_cache_path)
+        except OSError as e:
+            self.logger.warning(f"Could not cache client version: {e}")
+
+    def load_version(self) -> str:
+        """
+        Client version of the running game build. The local client's own build string is used when it is in
+        riotClientVersion format; otherwise valorant-api is asked, and its answer is reused for VERSION_TTL.
+        """
+        build = self._game_build()
+        if build and CLIENT_VERSION_PATTERN.match(build):
+            self.version = build
+            return self.version
+
+        versions = self._read_versions()
+        cached = versions.get(build) if build else None
+        if isinstance(cached, dict) and time.time() - cached.get("fetched_at", 0) < VERSION_TTL:
+            self.version = cached["version"]
+            return self.version
+
+        data = self.session.get("https://valorant-api.com/v1/version", verify=True, timeout=5)
+        self.version = data.json()["data"]["riotClientVersion"]
+        if build:
+            versions.pop(build, None)
+            versions[build] = {"version": self.version, "fetched_at": time.time()}
+            # Dicts keep insertion order, so the oldest builds come first
+            self._write_versions(dict(list(versions.items())[-MAX_CACHED_BUILDS:]))
+        return self.version
+
+    def _refresh(self):
+        if self.version is None:
+            self.load_version()
+        entitlements = self._local("/entitlements/v1/token")
+        expiries = [e for e in (jwt_expiry(entitlements["accessToken"]), jwt_expiry(entitlements["token"])) if e]
+        self.expires_at = min(expiries) if expiries else time.time() + DEFAULT_TOKEN_LIFETIME
+        self.subject = entitlements["subject"]
+        # Always a new dict: callers compare against the headers they used to tell whether they are stale
+        self.headers = {
+            "Authorization": f"Bearer {entitlements['accessToken']}",
+            "X-Riot-Entitlements-JWT": entitlements["token"],
+            "X-Riot-ClientPlatform": CLIENT_PLATFORM,
+            "X-Riot-ClientVersion": self.version,
+            "User-Agent": USER_AGENT,
+        }
+        self.logger.info(f"Refreshed Riot tokens, valid for {self.expires_at - time.time():.0f}s")
+
+    def get(self) -> Dict[str, str]:
+        """Headers that have not expired yet, fetching new tokens if needed."""
+        with self.lock:
+            if not self.valid:
+                self._refresh()
+            return self.headers
+
+    def refresh(self, stale: Optional[Dict[str, str]] = None) -> Dict[str, str]:
+        """Fetch new tokens, unless the stale headers were already replaced by another caller."""
+        with self.lock:
+            if stale is None or stale is self.headers or not self.headers:
+                self._refresh()
+            return self.headers
+
+    def start(self):
+        if self.task is None:
+            self.task = asyncio.create_task(self._refresh_loop())
+
+    async def close(self):
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+
+    async def _refresh_loop(self):
+        while True:
+            await asyncio.sleep(max(REFRESH_RETRY_DELAY, self.expires_at - REFRESH_MARGIN - time.time()))
+            try:
+                await asyncio.to_thread(self.refresh)
+            except Exception as e:
+                self.logger.warning(f"Background token refresh failed: {e}")
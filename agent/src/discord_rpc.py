@@ -1,20 +1,37 @@
 from pypresence import Presence
+import threading
 import time
-import nest_asyncio
+from datetime import datetime, timezone
 from models import *
+from name_service import get_rpc_gamemodes
+from snapshot import TickSnapshot
 import logging
 
 client_id = "1389311125681606666"
-nest_asyncio.apply()
+# Discord applies at most one activity update per this many seconds; also the delay between reconnect attempts
+RATE_WINDOW = 15.0
 
 
 class DiscordRPC:
+    """
+    Discord Rich Presence, driven by a dedicated worker thread so RPC latency or a Discord reconnect never holds up
+    the agent loop. The set_* methods only drop the newest payload into a mailbox. The worker sends at most one update
+    per RATE_WINDOW, always the latest payload, and skips payloads identical to what is already shown (ignoring the
+    start timestamp, so the elapsed timer keeps running).
+    """
+
     def __init__(self):
         self.client_id = client_id
         self.presence = None
         self.connected = False
-        self.connect()
         self.last_update_id = None
+        self.mailbox = None
+        self.shown = None
+        self.last_sent_at = 0.0
+        self.closed = False
+        self.condition = threading.Condition()
+        self.worker = threading.Thread(target=self._run, name="discord-rpc", daemon=True)
+        self.worker.start()
 
     def connect(self):
         """Connect to Discord RPC"""
@@ -22,6 +39,7 @@ class DiscordRPC:
             return True
 
         try:
+            # Runs on the worker thread, pypresence gets its own event loop there
             self.presence = Presence(self.client_id)
             self.presence.connect()
             self.connected = True
@@ -42,53 +60,122 @@ class DiscordRPC:
             except Exception as e:
                 print(f"Error during disconnect: {e}")
 
-    def set_presence(self, state=None, details=None, start=None, large_image=None, large_text=None, small_image=None, small_text=None,party_size=None):
-        """Update Discord presence with given parameters"""
-        if not self.connected:
-            if not self.connect():
+    def close(self):
+        """Stop the worker, which disconnects from Discord on its way out"""
+        with self.condition:
+            self.closed = True
+            self.condition.notify()
+        self.worker.join(timeout=5)
+
+    @staticmethod
+    def _without_start(payload: dict) -> dict:
+        return {k: v for k, v in payload.items() if k != "start"}
+
+    def _post(self, payload: dict):
+        with self.condition:
+            self.mailbox = payload
+            self.condition.notify()
+
+    def _next_payload(self):
+        """Wait for a payload that differs from the one shown and for the rate window to pass; None once closed."""
+        with self.condition:
+            while not self.closed:
+                if self.mailbox is not None and self._without_start(self.mailbox) == self.shown:
+                    self.mailbox = None
+                if self.mailbox is None:
+                    self.condition.wait()
+                    continue
+                wait = self.last_sent_at + RATE_WINDOW - time.monotonic()
+                if wait > 0:
+                    # Newer payloads replace the mailbox meanwhile, only the latest goes out
+                    self.condition.wait(wait)
+                    continue
+                payload, self.mailbox = self.mailbox, None
+                return payload
+            return None
+
+    def _run(self):
+        while (payload := self._next_payload()) is not None:
+            self.last_sent_at = time.monotonic()
+            if not self.connected and not self.connect():
                 print("Cannot update presence - not connected to Discord")
-                return
+                self._retry(payload)
+                continue
+            try:
+                self.presence.update(**payload)
+                self.shown = self._without_start(payload)
+            except Exception as e:
+                print(f"Failed to update Discord presence: {e}")
+                self.connected = False
+                self._retry(payload)
+        self.disconnect()
 
-        try:
-            presence_data = {
-                "state": state,
-                "details": details,
-                "start": start,
-                "large_image": large_image,
-                "large_text": large_text,
-                "small_image": small_image,
-                "small_text": small_text,
-                "party_size": party_size,
-            }
-
-            self.presence.update(**presence_data, instance=True, party_id="abc")
-        except Exception as e:
-            print(f"Failed to update Discord presence: {e}")
+    def _retry(self, payload: dict):
+        # Keep the payload for the next window unless a newer one arrived
+        with self.condition:
+            if self.mailbox is None:
+                self.mailbox = payload
+
+    def set_presence(self, state=None, details=None, start=None, large_image=None, large_text=None, small_image=None, small_text=None,party_size=None):
+        """Queue a Discord presence update with given parameters"""
+        self._post({
+            "state": state,
+            "details": details,
+            "start": start,
+            "large_image": large_image,
+            "large_text": large_text,
+            "small_image": small_image,
+            "small_text": small_text,
+            "party_size": party_size,
+            "instance": True,
+            "party_id": "abc",
+        })
+
+    async def set_menus_presence(self, snapshot: TickSnapshot):
+        """Set presence for the main menu / queue from the tick's party data"""
+        party_state = await snapshot.party_state()
+        party_data = await snapshot.party_presence()
+        self.set_presence(
+            state="In Menu" if party_state["state"] == "DEFAULT" else "In Queue",
+            details=get_rpc_gamemodes(party_state["queueId"]),
+            party_size=[1 if party_data.get("partySize")==0 else party_data.get("partySize"),5],
+            start=int(datetime.now(timezone.utc).timestamp()),
+            large_image="logo",
+        )
+
+    async def set_pregame_presence(self, snapshot: TickSnapshot, pregame_data: dict):
+        """Set presence for agent select from the tick's party data and the pregame info"""
+        party_data = await snapshot.party_presence()
+        self.set_presence(
+            state="Party Size: " + str(party_data.get("partySize", 0)) if party_data.get("isValid") else "Solo",
+            details=f"{pregame_data['Mode']} | Pregame",
+            large_image=pregame_data['Map'].lower(),
+            large_text=f"{pregame_data['Map']}",
+            small_image=pregame_data['Character'].lower().replace("/", "") if pregame_data["Character"] != "" else None,
+            small_text=f"Locked {pregame_data['Character']}" if pregame_data["CharacterSelectionState"] == "locked" else f"Selected {pregame_data['Character']}",
+            party_size=[party_data.get('partySize', 1),5],
+        )
 
     def set_match_presence(self, match_data:CurrentMatch, player: CurrentMatchPlayer, start_time:int = None, base_url:str = "http://localhost/live/"):
-        """Set presence based on match data"""
+        """Queue a presence update based on match data"""
         if not match_data or not match_data.match_uuid:
             return
 
-        try:
-            print(f"Setting match presence for {match_data.match_uuid}\n {match_data}\n {player}")
-            self.last_update_id = match_data.match_uuid
-
-            state = "Solo" if match_data.party_size == 1 else "In a party"
-            details = f"{match_data.game_mode} {match_data.party_owner_score}-{match_data.party_owner_enemy_score}"
-
-            response = self.presence.update(
-                state=state,
-                details=details,
-                start=int(time.time()),
-                large_image=match_data.game_map.lower(),
-                large_text=match_data.game_map,
-                small_image=player.character.lower().replace("/", ""),
-                small_text=player.character,
-                party_size=[match_data.party_size,5],
-                instance=True,
-                buttons=[{"label": "Live Stats", "url": f"{base_url}/live/{match_data.match_uuid}"}]
-            )
+        print(f"Setting match presence for {match_data.match_uuid}\n {match_data}\n {player}")
+        self.last_update_id = match_data.match_uuid
 
-        except Exception as e:
-            print(f"Failed to set match presence: {e}")
+        state = "Solo" if match_data.party_size == 1 else "In a party"
+        details = f"{match_data.game_mode} {match_data.party_owner_score}-{match_data.party_owner_enemy_score}"
+
+        self._post({
+            "state": state,
+            "details": details,
+            "start": int(time.time()),
+            "large_image": match_data.game_map.lower(),
+            "large_text": match_data.game_map,
+            "small_image": player.character.lower().replace("/", ""),
+            "small_text": player.character,
+            "party_size": [match_data.party_size,5],
+            "instance": True,
+            "buttons": [{"label": "Live Stats", "url": f"{base_url}/live/{match_data.match_uuid}"}],
+        })
@@ -1,31 +1,24 @@
-import datetime
 import time
 
-from models import EnhancedJSONEncoder
-from datetime import timezone
-from presence import Presence, decode_presence
-from discord_rpc import DiscordRPC
+# Measured first, so the startup report includes module imports (the bulk of a cold start of the packaged build)
+IMPORT_STARTED = time.perf_counter()
+
 import asyncio
-from req import Requests
 from models import CurrentMatch
 import logging
-from match import Match
-from user import Users
-import requests
-import websockets
-import json
 import os
 from dotenv import load_dotenv
-from datetime import datetime
-from pregame import Pregame
-from name_service import get_rpc_gamemodes
-from player_stats import PlayerStats
+from snapshot import TickSnapshot
+from bootstrap import Services
 
 load_dotenv()
 
-TIMEOUT=5
-
-req = Requests()
+# Number of players enriched concurrently when a new match is detected
+ENRICH_CONCURRENCY = int(os.getenv("ENRICH_CONCURRENCY", 5))
+# Create the match with the basic roster right away and stream each player's rank and stats as they resolve
+PROGRESSIVE_ENRICHMENT = os.getenv("PROGRESSIVE_ENRICHMENT", "true").lower() != "false"
+# Offer the compact MessagePack wire format to the backend (falls back to JSON if either side lacks msgpack)
+BINARY_WIRE_FORMAT = os.getenv("BINARY_WIRE_FORMAT", "true").lower() != "false"
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
@@ -33,7 +26,6 @@ logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(level
 # Create logger properly
 logger = logging.getLogger(__name__)
 
-base_url = f"http://{os.getenv('BASE_URL')}/api"
 ws_url = f"ws://{os.getenv('BASE_URL')}/ws"
 web_url = os.getenv("WEB_URL")
 # API Key for authentication - get this from backend startup logs
@@ -42,124 +34,17 @@ API_KEY = os.getenv("VPT_API_KEY")
 if not API_KEY or not web_url:
     logger.error("ENV not set correctly")
 
-user = Users(req)
-m = Match(req, user)
-p = Presence(req)
-rpc = DiscordRPC()
-pre = Pregame(req, user)
-stats = PlayerStats(req)
-
-def get_headers():
-    """Get headers with API key authentication"""
-    return {
-        'Content-Type': 'application/json',
-        'Authorization': f'Bearer {API_KEY}'
-    }
-
-
-async def create_active_match_via_api(match_data: CurrentMatch):
-    """
-    Create an active match with players via API call
-    """
-    # Prepare the payload for the API
-    payload = {
-        "match_uuid": match_data.match_uuid,
-        "game_map": match_data.game_map,
-        "game_start": match_data.game_start,
-        "game_mode": match_data.game_mode,
-        "state": match_data.state,
-        "party_owner_score": match_data.party_owner_score,
-        "party_owner_enemy_score": match_data.party_owner_enemy_score,
-        "party_owner_average_rank": match_data.party_owner_average_rank,
-        "party_owner_enemy_average_rank": match_data.party_owner_enemy_average_rank,
-        "party_owner_team_id": match_data.party_owner_team_id,
-        "party_size": match_data.party_size,
-        "players": []
-    }
-
-    # Process players data
-    if match_data.players:
-        for player in match_data.players:
-            player_data = {
-                "subject": player.subject,
-                "character": player.character,
-                "team_id": player.team_id,
-                "game_name": player.game_name,
-                "account_level": player.account_level,
-                "player_card_id": player.player_card_id,
-                "player_title_id": player.player_title_id,
-                "preferred_level_border_id": player.preferred_level_border_id,
-                "agent_icon": player.agent_icon,
-                "rank": player.rank,
-                "rr": player.rr,
-                "leaderboard_rank": player.leaderboard_rank,
-                "kd": player.kd,
-                "hs": player.hs_percentage,
-                "adr": player.adr,
-                "peak_rank": player.peak_rank
-            }
-            payload["players"].append(player_data)
-
-    response = requests.post(f"{base_url}/active_matches/", json=payload, headers=get_headers())
-    logger.info(f"Creating active match entry for {match_data.match_uuid} with payload: {json.dumps(payload, cls=EnhancedJSONEncoder)}")
-    if response.status_code == 201:
-        logger.info(f"Successfully created active match entry for {match_data.match_uuid}")
-        return True
-    elif response.status_code == 400:
-        # Match might already exist, that's okay
-        logger.info(f"Active match {match_data.match_uuid} already exists")
-        return True
-    else:
-        logger.error(f"Failed to create active match: {response.status_code} - {response.text}")
-        return False
-
-
-async def end_active_match(match_uuid):
-    """End an active match entry in the backend"""
-    try:
-        end_payload = {"ended_at": datetime.now(timezone.utc).isoformat()}
-        end_response = requests.delete(f"{base_url}/active_matches/uuid/{match_uuid}/", json=end_payload,
-                                       headers=get_headers())
-        if end_response.status_code == 200:
-            logger.info(f"Successfully ended active match {match_uuid}")
-            return True
-
-        logger.error(
-            f"Could not find or end active match {match_uuid}. Status code: {end_response.status_code} - {end_response.text}")
-        return False
-    except Exception as e:
-        logger.error(f"Error ending active match: {str(e)}")
-        return False
-
-
-async def send_initial_match_data(ws, match_uuid, match_data):
-    """Send initial match data to populate the database"""
-    try:
-        message = {
-            "type": "match_update",
-            "match_uuid": match_uuid,
-            "data": match_data,
-            "timestamp": datetime.now(timezone.utc).isoformat()
-        }
-
-        await ws.send(json.dumps(message, cls=EnhancedJSONEncoder))
-        logger.info(f"Sent initial match data for {match_uuid}")
-        return True
-    except Exception as e:
-        logger.error(f"Error sending initial match data: {str(e)}")
-        return False
-
-
-async def run_agent():
+async def run_agent(services: Services):
+    req, user, m, p, rpc, pre = (services.requests, services.user, services.match, services.presence, services.rpc,
+                                 services.pregame)
+    presence_events, scheduler, agent_session = services.presence_events, services.scheduler, services.agent_session
+
     match_uuid = None
-    ws = None
-    last_update = None
     last_rpc_update = None
     last_game_state = None
 
-    active_match_created = False  # Track if we've created the active match via API
-    initial_data_sent = False     # Track if we've sent initial WebSocket data
-    message_queue = asyncio.Queue()
+    active_match_created = False  # Track if we've sent the match with its roster to the backend
+    enrichment_task = None        # Background task streaming player rank and stats in progressive mode
 
     def dicts_differ(d1, d2):
         if isinstance(d1, dict) and isinstance(d2, dict):
@@ -171,123 +56,95 @@ async def run_agent():
             return False
         return d1 != d2
 
-    async def handle_ws_messages(ws):
-        while True:
-            try:
-                raw = await ws.recv()
-                # Handle different response types
-                if raw == "ACK":
-                    msg = "ACK"
-                elif raw == "ERROR":
-                    msg = "ERROR"
-                else:
-                    try:
-                        msg = json.loads(raw)
-                    except json.JSONDecodeError:
-                        logger.warning(f"Received non-JSON message: {raw}")
-                        msg = raw
-
-                if msg == "ACK":
-                    # Put acknowledgment in queue
-                    await message_queue.put("ACK")
-                elif msg == "ERROR":
-                    # Put error in queue
-                    logger.error(f"Received ERROR response from backend")
-                    await message_queue.put("ERROR")
-                elif isinstance(msg, dict) and msg.get("type") == "request_data":
-                    try:
-                        if match_uuid and last_update:
-                            update_message = {
-                                "type": "match_update",
-                                "match_uuid": match_uuid,
-                                "data": last_update,
-                                "timestamp": datetime.now(timezone.utc).isoformat()
-                            }
-
-                            await ws.send(json.dumps(update_message, cls=EnhancedJSONEncoder))
-                            logger.info(f"Sent data in response to request for match {match_uuid}")
-                    except Exception as e:
-                        logger.error(f"Error handling request_data: {str(e)}")
-                        raise e
-                else:
-                    logger.info(f"Received message: {msg}")
-            except websockets.exceptions.ConnectionClosed:
-                logger.info("WebSocket connection closed in message handler")
-                break
-            except Exception as e:
-                logger.error(f"Error handling WebSocket message: {raw}")
-                logger.error(f"Error in message handler: {str(e)}")
-                raise e
-
-    def reset_match_state():
-        """Reset all match-related state variables"""
-        nonlocal match_uuid, ws, last_update, last_rpc_update, active_match_created, initial_data_sent
+    async def stream_player_enrichment(current_match: CurrentMatch):
+        """Send each player's rank and stats as soon as they resolve, then the team average ranks."""
+        rank_nums = {}
+        try:
+            async for enriched, rank_num in m.iter_enriched_players(current_match.players):
+                rank_nums[enriched.subject] = rank_num
+                if agent_session.update_player(current_match.match_uuid, enriched):
+                    logger.info(f"Queued rank and stats of {enriched.game_name} for match {current_match.match_uuid}")
+        except Exception as e:
+            # The averages still go out, over the players that did resolve
+            logger.error(f"Streaming player data for match {current_match.match_uuid} failed: {e}")
+
+        average_rank, enemy_average_rank = m.average_ranks(
+            current_match.players, rank_nums, current_match.party_owner_team_id
+        )
+        # Only the averages: current_match is as old as the roster, and its scores and rounds would undo newer ticks
+        agent_session.update_fields(current_match.match_uuid, {
+            "party_owner_average_rank": average_rank,
+            "party_owner_enemy_average_rank": enemy_average_rank,
+        })
+        logger.info(f"Finished streaming player data for match {current_match.match_uuid}")
+
+    def log_enrichment_result(task: asyncio.Task):
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"Player enrichment failed: {task.exception()}")
+
+    def end_match():
+        """End the tracked match and reset all match-related state variables"""
+        nonlocal match_uuid, last_rpc_update, active_match_created, enrichment_task
+        if enrichment_task is not None:
+            enrichment_task.cancel()
+            enrichment_task = None
+        if match_uuid is not None:
+            agent_session.end_match(match_uuid)
         match_uuid = None
-        ws = None
-        last_update = None
         last_rpc_update = None
         active_match_created = False
-        initial_data_sent = False
 
-    party_id = p.get_party(m.user.user.puuid)
+    async def end_tick(snapshot: TickSnapshot, fingerprint=None):
+        """Wait for the next tick; fingerprint is what this tick saw, the interval backs off while it stays the same."""
+        delay = scheduler.tick_done(game_state, fingerprint)
+        logger.info(f"Tick used {snapshot.calls} requests, next in {delay:.1f}s")
+        if presence_events.connected:
+            # Presence and session events start the next tick early
+            if await presence_events.wait(delay):
+                scheduler.woken()
+        else:
+            await asyncio.sleep(delay)
+
+    agent_session.start()
+    presence_events.start()
 
     while True:
-        presence = p.get_presence()
-        game_state = p.get_game_state(presence)
+        snapshot = TickSnapshot(req, p, user.user.puuid, scheduler)
+        game_state = await snapshot.game_state()
 
         if game_state is None or game_state == "None":
             logger.info("No game state found, waiting for presence update...")
-            await asyncio.sleep(TIMEOUT)
+            await end_tick(snapshot)
             continue
 
         elif game_state == "MENUS":
             logger.info("In menus, waiting for game to start...")
-            party_state = p.get_party_state(party_id)
 
             # Clean up when transitioning from INGAME to MENUS
             if last_game_state == "INGAME" and match_uuid is not None:
-                await end_active_match(match_uuid)
-                if ws:
-                    await ws.close()
-                reset_match_state()
+                end_match()
 
 
             last_game_state = "MENUS"
-            party_data = decode_presence(p.get_private_presence(p.get_presence()))
-            presence_data = {
-                "state": "In Menu" if party_state["state"] == "DEFAULT" else "In Queue",
-                "details": get_rpc_gamemodes(party_state["queueId"]),
-                "party_size": [1 if party_data.get("partySize")==0 else party_data.get("partySize"),5],
-                "start": int(datetime.now(timezone.utc).timestamp()),
-                "large_image": "logo",
-            }
-            rpc.set_presence(**presence_data)
-
-            await asyncio.sleep(TIMEOUT)
+            await rpc.set_menus_presence(snapshot)
+
+            await end_tick(snapshot, await snapshot.private_presence())
             continue
 
         elif game_state == "PREGAME":
             logger.info("In pregame, waiting for match to start...")
-            pregame_data = pre.get_pregame_info()
+            pregame_data = await pre.get_pregame_info(snapshot)
             if pregame_data is None:
-                await asyncio.sleep(TIMEOUT)
+                await end_tick(snapshot)
                 continue
 
             last_game_state = "PREGAME"
+            await rpc.set_pregame_presence(snapshot, pregame_data)
+
+            # Warm the rank and stats caches for our team while agents are being picked
+            m.prefetch_players(await snapshot.pregame_match_id(), await pre.get_ally_puuids(snapshot))
 
-            party_data = decode_presence(p.get_private_presence(p.get_presence()))
-            presence_data = {
-                "state": "Party Size: " + str(party_data.get("partySize", 0)) if party_data.get("isValid") else "Solo",
-                "details": f"{pregame_data['Mode']} | Pregame",
-                "large_image": pregame_data['Map'].lower(),
-                "large_text": f"{pregame_data['Map']}",
-                "small_image": pregame_data['Character'].lower().replace("/", "") if pregame_data["Character"] != "" else None,
-                "small_text": f"Locked {pregame_data['Character']}" if pregame_data["CharacterSelectionState"] == "locked" else f"Selected {pregame_data['Character']}",
-                "party_size": [party_data.get('partySize', 1),5]
-            }
-            rpc.set_presence(**presence_data)
-
-            await asyncio.sleep(TIMEOUT)
+            await end_tick(snapshot, pregame_data)
             continue
 
         elif game_state == "INGAME":
@@ -295,11 +152,13 @@ async def run_agent():
             last_game_state = "INGAME"
             try:
                 # Get current match data
-                match_data, player = m.get_current_match_details(init=not active_match_created)
+                match_data, player = await m.get_current_match_details(
+                    snapshot, init=not active_match_created, enrich=not PROGRESSIVE_ENRICHMENT
+                )
 
                 if match_data is None:
                     logger.info("No match data found, waiting for next update...")
-                    await asyncio.sleep(TIMEOUT)
+                    await end_tick(snapshot)
                     continue
 
                 current_match_uuid = match_data.match_uuid
@@ -307,51 +166,22 @@ async def run_agent():
                 # Handle new match or first time in this match
                 if current_match_uuid != match_uuid:
                     # Clean up previous match if exists
-                    if match_uuid is not None:
-                        await end_active_match(match_uuid)
-                        if ws:
-                            await ws.close()
+                    end_match()
 
-                    # Reset state for new match
-                    reset_match_state()
-                    match_uuid = current_match_uuid
+                    if not match_data.players:
+                        # Roster was not fetched for this match yet, build it on the next tick
+                        await end_tick(snapshot)
+                        continue
 
-                    # Step 1: Create active match entry via API (only once per match)
+                    # Create the active match over the shared agent session
+                    match_uuid = current_match_uuid
                     logger.info(f"Creating new active match entry for {match_uuid}")
-                    success = await create_active_match_via_api(match_data)
-                    if success:
-                        active_match_created = True
-                        logger.info(f"Active match created successfully for {match_uuid}")
-                    else:
-                        logger.error(f"Failed to create active match for {match_uuid}")
-                        await asyncio.sleep(TIMEOUT)
-                        continue
+                    agent_session.create_match(match_data)
+                    active_match_created = True
 
-                    # Step 2: Connect to WebSocket
-                    try:
-                        ws = await websockets.connect(f"{ws_url}/agent/{match_uuid}?api_key={API_KEY}")
-                        logger.info(f"Connected to WebSocket for match {match_uuid}")
-
-                        # Start listening for incoming messages
-                        asyncio.create_task(handle_ws_messages(ws))
-
-                        # Step 3: Send initial data via WebSocket (different from API data)
-                        if not initial_data_sent:
-                            await send_initial_match_data(ws, match_uuid, match_data)
-                            initial_data_sent = True
-                            last_update = match_data
-
-                            # Wait for acknowledgment
-                            try:
-                                response = await asyncio.wait_for(message_queue.get(), timeout=2.0)
-                                logger.info(f"Received acknowledgment for initial data: {response}")
-                            except asyncio.TimeoutError:
-                                logger.info("No acknowledgment received for initial data")
-
-                    except Exception as e:
-                        logger.error(f"Failed to connect to WebSocket: {str(e)}")
-                        await asyncio.sleep(TIMEOUT)
-                        continue
+                    if PROGRESSIVE_ENRICHMENT:
+                        enrichment_task = asyncio.create_task(stream_player_enrichment(match_data))
+                        enrichment_task.add_done_callback(log_enrichment_result)
 
                 # Handle Discord RPC updates
                 if last_rpc_update is None:
@@ -361,50 +191,40 @@ async def run_agent():
                     rpc.set_match_presence(match_data, player=player, base_url=web_url)
                     last_rpc_update = match_data
 
-                # Handle WebSocket updates (only send if data has changed)
-                if ws and initial_data_sent:
-                    if last_update is None or dicts_differ(match_data, last_update):
-                        message = {
-                            "type": "match_update",
-                            "match_uuid": match_uuid,
-                            "data": match_data,
-                            "timestamp": datetime.now(timezone.utc).isoformat()
-                        }
-
-                        await ws.send(json.dumps(message, cls=EnhancedJSONEncoder))
-                        last_update = match_data
-                        logger.info(f"Sent live data update for match {match_uuid}")
-
-                        # Wait for acknowledgment
-                        try:
-                            response = await asyncio.wait_for(message_queue.get(), timeout=2.0)
-                            logger.info(f"Received response: {response}")
-                        except asyncio.TimeoutError:
-                            logger.warning("No acknowledgment received for update")
-                    else:
-                        logger.info("No new data to send, skipping WebSocket update...")
-
-            except websockets.exceptions.ConnectionClosed:
-                logger.info("WebSocket connection closed, will reconnect on next loop")
-                ws = None
-                initial_data_sent = False
+                # Handle WebSocket updates (only the fields that changed since the last message)
+                message = agent_session.update_match(match_data)
+                if message:
+                    logger.info(f"Queued {', '.join(message['data'])} update #{message['seq']} for match {match_uuid}")
+                else:
+                    logger.info("No new data to send, skipping WebSocket update...")
+
             except Exception as e:
                 logger.error(f"Error in agent loop: {str(e)}")
-                ws = None
-                initial_data_sent = False
+                match_data = None
 
-            await asyncio.sleep(TIMEOUT)
+            await end_tick(snapshot, match_data)
         else:
             # Handle other game states - clean up if needed
             if match_uuid is not None:
-                await end_active_match(match_uuid)
-                if ws:
-                    await ws.close()
-                reset_match_state()
+                end_match()
 
-            await asyncio.sleep(TIMEOUT)
+            await end_tick(snapshot)
+
+
+async def main():
+    services = await Services.create(
+        f"{ws_url}/agent",
+        API_KEY,
+        enrich_concurrency=ENRICH_CONCURRENCY,
+        encodings=None if BINARY_WIRE_FORMAT else [],
+        imports=time.perf_counter() - IMPORT_STARTED,
+    )
+    try:
+        await run_agent(services)
+    finally:
+        await services.close()
 
 
 if __name__ == "__main__":
-    asyncio.run(run_agent())
+    asyncio.run(main())
     # print(json.dumps(m.get_match_details("4c1d989d-d335-4431-b4fb-985bd336baaa"), cls=EnhancedJSONEncoder))
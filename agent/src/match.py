@@ -1,4 +1,5 @@
-from typing import Optional, Tuple
+import asyncio
+from typing import AsyncIterator, Dict, FrozenSet, List, Optional, Tuple
 from req import Requests
 from user import Users
 import logging
@@ -19,29 +20,45 @@ from models import (
     CurrentMatch,
     Player,
     SingleMatch,
+    CurrentPlayerStats,
+    RankRecord,
 )
 import urllib3
 from player_stats import PlayerStats
-from constants import before_ascendant_seasons
+from snapshot import TickSnapshot
+from rank_cache import RankCache
 
 urllib3.disable_warnings()
 
+# How many players are enriched (rank + recent stats) at the same time when a match is first detected
+DEFAULT_ENRICH_CONCURRENCY = 5
+
 class Match:
-    def __init__(self, requests: Requests, user: Users):
+    def __init__(self, requests: Requests, user: Users, enrich_concurrency: int = DEFAULT_ENRICH_CONCURRENCY,
+                 presence: Optional[Presence] = None, stats: Optional[PlayerStats] = None):
         self.requests = requests
+        self.enrich_concurrency = max(1, enrich_concurrency)
         self.user = user
         self.logger = logging.getLogger(__name__)
         self.logger.setLevel(logging.DEBUG)
-        self.presence = Presence(self.requests)
-        self.stats = PlayerStats(self.requests)
+        self.presence = presence or Presence(self.requests)
+        self.stats = stats or PlayerStats(self.requests)
+        self.rank_cache = RankCache()
+        self.prefetch_task: Optional[asyncio.Task] = None
+        self.prefetch_match_id: Optional[str] = None
+        # Players the running prefetch is enriching
+        self.prefetch_puuids: FrozenSet[str] = frozenset()
+        self.match_start = {}
 
-        user_rank, _ = self.get_rank_by_uuid(self.user.user.puuid)
+    async def load_user_rank(self):
+        """Fetch our own rank; not needed by the agent loop, so the bootstrap runs it in the background."""
+        data = await self.requests.afetch("pd", f"/mmr/v1/players/{self.user.user.puuid}", "get")
+        user_rank, _ = self.format_rank(self.update_rank(self.user.user.puuid, data))
         self.user.user.rank = user_rank["rank"]
         self.user.user.rr = user_rank["rr"]
-        self.match_start = {}
 
-    def get_own_match_history(self, last: int = 10) -> MatchHistory:
-        match_history = self.requests.fetch("pd", f"/match-history/v1/history/{self.user.user.puuid}", "get")
+    async def get_own_match_history(self, last: int = 10) -> MatchHistory:
+        match_history = await self.requests.afetch("pd", f"/match-history/v1/history/{self.user.user.puuid}", "get")
         match_history = match_history["History"][:last]
         matches = [
             BareMatch(
@@ -54,11 +71,15 @@ class Match:
 
         return MatchHistory(match_ids=matches, subject=self.user.user.puuid)
 
-    def get_current_match_details(
-        self, init: bool = False
+    async def get_current_match_details(
+        self, snapshot: TickSnapshot, init: bool = False, enrich: bool = True
     ) -> Tuple[Optional[CurrentMatch], Optional[CurrentMatchPlayer]]:
+        """
+        Build the current match. With init the player roster is included, and with enrich it also carries every
+        player's rank and stats; without enrich they can be streamed afterwards via iter_enriched_players.
+        """
 
-        match_id = self.get_current_match_id()
+        match_id = await self.get_current_match_id(snapshot)
         if not match_id:
             self.logger.debug("No current match found.")
             return None
@@ -66,8 +87,8 @@ class Match:
         if match_id not in self.match_start.keys():
             self.match_start = {match_id: datetime.datetime.now().isoformat()}
 
-        presence = self.presence.get_private_presence(self.presence.get_presence())
-        data = self.requests.fetch("glz", f"/core-game/v1/matches/{match_id}", "get")
+        presence = await snapshot.private_presence()
+        data = await snapshot.core_game_match()
 
         match_stats = {
             k: v
@@ -79,86 +100,185 @@ class Match:
         players = []
         player = None
         puuids = [p["Subject"] for p in data["Players"]]
-        names = get_multiple_names_from_puuid(puuids, self.requests)
+        names = await get_multiple_names_from_puuid(puuids, self.requests)
 
         for p in data["Players"]:
             if p["Subject"] == self.user.user.puuid:
-                player = CurrentMatchPlayer(
-                    subject=p["Subject"],
-                    character=get_agent_name(p["CharacterID"]),
-                    team_id=p["TeamID"],
-                    game_name=names.get(p["Subject"], "Unknown Player"),
-                    account_level=p["PlayerIdentity"].get("AccountLevel"),
-                    player_card_id=p["PlayerIdentity"].get("PlayerCardID"),
-                    player_title_id=p["PlayerIdentity"].get("PlayerTitleID"),
-                    preferred_level_border_id=p["SeasonalBadgeInfo"].get("PreferredLevelBorderID"),
-                    agent_icon=get_agent_icon(p["CharacterID"]),
-                    rank="placeholder",
-                    peak_rank="placeholder"
-                )
+                player = self.build_player(p, names, rank="placeholder", peak_rank="placeholder")
 
         if init:
-            party_owner_average_rank_num = 0
-            party_owner_players = 0
-            party_owner_enemy_average_rank_num = 0
-            party_owner_enemy_players = 0
-
-            for p in data["Players"]:
-                rank, rank_num = self.get_rank_by_uuid(p["Subject"])
-                player_stats = self.stats.get_stats(p["Subject"])
-
-                players.append(
-                    CurrentMatchPlayer(
-                        subject=p["Subject"],
-                        character=get_agent_name(p["CharacterID"]),
-                        team_id=p["TeamID"],
-                        game_name=names.get(p["Subject"], "Unknown Player"),
-                        account_level=p["PlayerIdentity"].get("AccountLevel"),
-                        player_card_id=p["PlayerIdentity"].get("PlayerCardID"),
-                        player_title_id=p["PlayerIdentity"].get("PlayerTitleID"),
-                        preferred_level_border_id=p["SeasonalBadgeInfo"].get("PreferredLevelBorderID"),
-                        agent_icon=get_agent_icon(p["CharacterID"]),
-                        rank=rank["rank"],
-                        rr=rank["rr"],
-                        peak_rank=rank["peak_rank"],
-                        hs_percentage=player_stats.hs,
-                        adr=player_stats.adr,
-                        kd=player_stats.kd
-                    )
-                )
+            # Basic roster first; rank and stats are filled in below or streamed later in progressive mode
+            players = [self.build_player(p, names) for p in data["Players"]]
 
-                if p["TeamID"] == player.team_id:
-                    if rank_num != 0:
-                        party_owner_average_rank_num += rank_num
-                        party_owner_players += 1
-                else:
-                    if rank_num != 0:
-                        party_owner_enemy_average_rank_num += rank_num
-                        party_owner_enemy_players += 1
-
-            party_owner_enemy_average_rank = get_rank_by_id(
-                int(party_owner_enemy_average_rank_num / party_owner_enemy_players if party_owner_enemy_players != 0 else 0))[
-                "tierName"]
-            party_owner_average_rank = \
-                get_rank_by_id(int(party_owner_average_rank_num / party_owner_players if party_owner_players != 0 else 0))["tierName"]
+            if enrich:
+                enriched = await self.enrich_players(puuids)
+                rank_nums = {}
+
+                for current in players:
+                    rank, rank_num, player_stats = enriched[current.subject]
+                    self.apply_enrichment(current, rank, player_stats)
+                    rank_nums[current.subject] = rank_num
+
+                party_owner_average_rank, party_owner_enemy_average_rank = self.average_ranks(
+                    players, rank_nums, player.team_id
+                )
 
         return CurrentMatch(
             match_uuid=data["MatchID"],
             game_map=get_map_name(data["MapID"]),
             game_start=self.match_start[data["MatchID"]],
-            game_mode=self.get_current_gamemode(),
+            game_mode=await self.get_current_gamemode(snapshot),
             state=data["State"],
             party_owner_score=match_stats.get("partyOwnerMatchScoreAllyTeam", 0),
             party_owner_enemy_score=match_stats.get("partyOwnerMatchScoreEnemyTeam", 0),
-            party_owner_average_rank=party_owner_average_rank if init else None,
-            party_owner_enemy_average_rank=party_owner_enemy_average_rank if init else None,
+            party_owner_average_rank=party_owner_average_rank if init and enrich else None,
+            party_owner_enemy_average_rank=party_owner_enemy_average_rank if init and enrich else None,
             party_owner_team_id=player.team_id,
             party_size=match_stats.get("partySize", 1),
             players=players,
         ), player
 
-    def get_match_details(self, match_id: str) -> SingleMatch:
-        match = self.requests.fetch("pd", f"/match-details/v1/matches/{match_id}", "get")
+    def prefetch_players(self, match_id: str, puuids: List[str]):
+        """
+        Start enriching players that are already known before the match goes in-game (e.g. allies in agent select).
+        Results land in the rank and stats caches, so the first in-game update only has to fetch the rest.
+        """
+        if not puuids or match_id == self.prefetch_match_id:
+            return
+
+        self.prefetch_match_id = match_id
+        self.prefetch_puuids = frozenset(puuids)
+        self.prefetch_task = asyncio.create_task(self._enrich_players(puuids))
+        self.prefetch_task.add_done_callback(self._log_prefetch_result)
+        self.logger.info(f"Prefetching rank and stats for {len(puuids)} players of match {match_id}")
+
+    def _log_prefetch_result(self, task: asyncio.Task):
+        if not task.cancelled() and task.exception() is not None:
+            self.logger.error(f"Prefetching players failed: {task.exception()}")
+
+    async def enrich_players(self, puuids: List[str]) -> Dict[str, Tuple[dict, int, CurrentPlayerStats]]:
+        """
+        Fetch rank and recent stats for all players concurrently.
+        At most enrich_concurrency requests of each kind are in flight at once, so the slowest player bounds the total time.
+        Recent matches shared between players are only downloaded once.
+        Players a running prefetch covers wait for it and come from the caches instead of being fetched twice.
+        """
+        return dict(await asyncio.gather(*await self._start_after_prefetch(puuids)))
+
+    async def _enrich_players(self, puuids: List[str]) -> Dict[str, Tuple[dict, int, CurrentPlayerStats]]:
+        return dict(await asyncio.gather(*await self.start_enrichment(puuids)))
+
+    async def start_enrichment(self, puuids: List[str]) -> List[asyncio.Future]:
+        """Start enriching the players; each future resolves to (puuid, (rank, rank_num, stats)) on its own."""
+        semaphore = asyncio.Semaphore(self.enrich_concurrency)
+        player_stats = await self.stats.start_stats(puuids, concurrency=self.enrich_concurrency)
+
+        async def enrich(puuid: str):
+            async with semaphore:
+                rank, rank_num = await self.get_rank_by_uuid(puuid)
+            return puuid, (rank, rank_num, await player_stats[puuid])
+
+        return [asyncio.ensure_future(enrich(puuid)) for puuid in puuids]
+
+    async def _start_after_prefetch(self, puuids: List[str]) -> List[asyncio.Future]:
+        """
+        start_enrichment, in the same order, except that players a running prefetch covers are only started once it
+        is done. Everyone else starts right away instead of queueing behind the prefetch.
+        """
+        prefetch = self.prefetch_task
+        if prefetch is None or prefetch.done():
+            return await self.start_enrichment(puuids)
+
+        prefetched = [puuid for puuid in puuids if puuid in self.prefetch_puuids]
+        rest = [puuid for puuid in puuids if puuid not in self.prefetch_puuids]
+        started = dict(zip(rest, await self.start_enrichment(rest)))
+        if prefetched:
+            async def start_prefetched() -> Dict[str, asyncio.Future]:
+                await asyncio.wait([prefetch])
+                return dict(zip(prefetched, await self.start_enrichment(prefetched)))
+
+            group = asyncio.ensure_future(start_prefetched())
+
+            async def after_prefetch(puuid: str):
+                # Shielded: one waiter being cancelled must not cancel the others
+                return await (await asyncio.shield(group))[puuid]
+
+            started.update({puuid: asyncio.ensure_future(after_prefetch(puuid)) for puuid in prefetched})
+        return [started[puuid] for puuid in puuids]
+
+    async def iter_enriched_players(self, players: List[CurrentMatchPlayer]) -> AsyncIterator[Tuple[CurrentMatchPlayer, int]]:
+        """
+        Yield each player with rank and stats filled in, together with its rank number, as soon as it resolves.
+        A player whose rank or stats could not be fetched is logged and skipped; the others are still yielded.
+        """
+        by_subject = {p.subject: p for p in players}
+        futures = await self._start_after_prefetch(list(by_subject))
+        # future -> subject, to tell which player failed
+        pending = dict(zip(futures, by_subject))
+        while pending:
+            done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for future in done:
+                subject = pending.pop(future)
+                try:
+                    puuid, (rank, rank_num, player_stats) = future.result()
+                except Exception as e:
+                    self.logger.error(f"Enriching player {subject} failed: {e}")
+                    continue
+                current = by_subject[puuid]
+                self.apply_enrichment(current, rank, player_stats)
+                yield current, rank_num
+
+    def build_player(self, p: dict, names: Dict[str, str], rank: str = "", peak_rank: str = "") -> CurrentMatchPlayer:
+        return CurrentMatchPlayer(
+            subject=p["Subject"],
+            character=get_agent_name(p["CharacterID"]),
+            team_id=p["TeamID"],
+            game_name=names.get(p["Subject"], "Unknown Player"),
+            account_level=p["PlayerIdentity"].get("AccountLevel"),
+            player_card_id=p["PlayerIdentity"].get("PlayerCardID"),
+            player_title_id=p["PlayerIdentity"].get("PlayerTitleID"),
+            preferred_level_border_id=p["SeasonalBadgeInfo"].get("PreferredLevelBorderID"),
+            agent_icon=get_agent_icon(p["CharacterID"]),
+            rank=rank,
+            peak_rank=peak_rank
+        )
+
+    def apply_enrichment(self, player: CurrentMatchPlayer, rank: dict, player_stats: CurrentPlayerStats):
+        player.rank = rank["rank"]
+        player.rr = rank["rr"]
+        player.peak_rank = rank["peak_rank"]
+        player.hs_percentage = player_stats.hs
+        player.adr = player_stats.adr
+        player.kd = player_stats.kd
+
+    def average_ranks(self, players: List[CurrentMatchPlayer], rank_nums: Dict[str, int], team_id: str) -> Tuple[str, str]:
+        """Average rank of the party owner's team and of the enemy team, ignoring unranked players."""
+        party_owner_average_rank_num = 0
+        party_owner_players = 0
+        party_owner_enemy_average_rank_num = 0
+        party_owner_enemy_players = 0
+
+        for p in players:
+            rank_num = rank_nums.get(p.subject, 0)
+            if p.team_id == team_id:
+                if rank_num != 0:
+                    party_owner_average_rank_num += rank_num
+                    party_owner_players += 1
+            else:
+                if rank_num != 0:
+                    party_owner_enemy_average_rank_num += rank_num
+                    party_owner_enemy_players += 1
+
+        party_owner_enemy_average_rank = get_rank_by_id(
+            int(party_owner_enemy_average_rank_num / party_owner_enemy_players if party_owner_enemy_players != 0 else 0))[
+            "tierName"]
+        party_owner_average_rank = \
+            get_rank_by_id(int(party_owner_average_rank_num / party_owner_players if party_owner_players != 0 else 0))["tierName"]
+
+        return party_owner_average_rank, party_owner_enemy_average_rank
+
+    async def get_match_details(self, match_id: str) -> SingleMatch:
+        match = await self.requests.afetch_match_details(match_id)
         match_info = match["matchInfo"]
         players = [
             Player(
@@ -187,58 +307,49 @@ class Match:
             players=players,
         )
 
-    def get_current_match_id(self) -> str:
-        match = self.requests.fetch("glz", f"/core-game/v1/players/{self.user.user.puuid}", "get")
+    async def get_current_match_id(self, snapshot: TickSnapshot) -> str:
+        match_id = await snapshot.core_game_match_id()
 
-        if match and "MatchID" in match:
-            return match["MatchID"]
+        if match_id:
+            return match_id
 
         raise Exception("Could not find current match ID. Make sure you are in a match.")
 
-    def get_current_gamemode(self) -> str:
-        presence_data_raw = self.presence.get_private_presence(self.presence.get_presence())
+    async def get_current_gamemode(self, snapshot: TickSnapshot) -> str:
+        presence_data_raw = await snapshot.private_presence()
         gamemode = get_gamemodes_from_codename(presence_data_raw["queueId"])
         return gamemode
 
 
 
-    def get_rank_by_uuid(self, uuid: str) -> (dict, int):
-        try:
-            data = self.requests.fetch("pd", f"/mmr/v1/players/{uuid}", "get")
-            if not data:
-                return {"rank": "Unranked", "rr": None, "peak_rank": "Unranked"}, 0
-
-            latest_rank = data["LatestCompetitiveUpdate"]["TierAfterUpdate"]
-            latest_rr = data["LatestCompetitiveUpdate"]["RankedRatingAfterUpdate"]
+    async def get_rank_by_uuid(self, uuid: str) -> (dict, int):
+        record = self.rank_cache.get(uuid)
+        if record is None:
+            data = await self.requests.afetch("pd", f"/mmr/v1/players/{uuid}", "get")
+            record = self.update_rank(uuid, data)
+        return self.format_rank(record)
 
-            # Initialize peak rank with current rank
-            peak_rank_num = latest_rank
-
-            # Get seasonal info for peak rank calculation
-            seasons = data["QueueSkills"]["competitive"].get("SeasonalInfoBySeasonID")
-            if seasons is not None:
-                for season_id in seasons:
-                    season_data = seasons[season_id]
-                    wins_by_tier = season_data.get("WinsByTier")
+    def update_rank(self, uuid: str, data: Optional[dict]) -> Optional[RankRecord]:
+        try:
+            return self.rank_cache.update(uuid, data)
+        except Exception:
+            self.logger.exception(f"Could not parse rank for {uuid}")
+            return None
 
-                    if wins_by_tier is not None:
-                        for tier_str in wins_by_tier:
-                            tier_num = int(tier_str)
-                            if season_id in before_ascendant_seasons:
-                                tier_num += 3
-                            # Check if this tier is higher than current peak
-                            if tier_num > peak_rank_num:
-                                peak_rank_num = tier_num
+    def format_rank(self, record: Optional[RankRecord]) -> (dict, int):
+        try:
+            if record is None:
+                return {"rank": "Unranked", "rr": None, "peak_rank": "Unranked"}, 0
 
-            peak_rank = get_rank_by_id(peak_rank_num)
+            peak_rank = get_rank_by_id(record.peak_tier)
 
             ret = {
-                "rank": get_rank_by_id(latest_rank).get("tierName", "Unranked"),
-                "rr": latest_rr,
+                "rank": get_rank_by_id(record.tier).get("tierName", "Unranked"),
+                "rr": record.rr,
                 "peak_rank": peak_rank.get("tierName", "Unranked") if peak_rank else "Unranked"
             }
 
-            return ret, latest_rank
+            return ret, record.tier
 
         except Exception:
             return {"rank": "Unranked", "rr": None, "peak_rank": "Unranked"}, 0
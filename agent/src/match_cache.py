@@ -0,0 +1,91 @@
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Optional
+
+from storage import get_data_path
+
+# Default size cap for the compressed payloads kept on disk
+DEFAULT_MAX_BYTES = 200 * 1024 * 1024
+
+
+class MatchDetailsCache:
+    """
+    Persistent cache for /match-details/v1/matches/{id} responses.
+    A finished match never changes, so payloads are stored zlib-compressed in SQLite together with the
+    sha256 of their content and evicted least-recently-used once the size cap is reached.
+    """
+
+    def __init__(self, path: Optional[str] = None, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.path = path or get_data_path("match_details.sqlite3")
+        self.max_bytes = max_bytes
+        self.logger = logging.getLogger(__name__)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS match_details (
+                match_id TEXT PRIMARY KEY,
+                digest TEXT NOT NULL,
+                payload BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                last_access REAL NOT NULL
+            )
+            """
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS match_details_last_access ON match_details (last_access)")
+        self.conn.commit()
+
+    def get(self, match_id: str) -> Optional[dict]:
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT digest, payload FROM match_details WHERE match_id = ?", (match_id,)
+            ).fetchone()
+            if row is None:
+                return None
+
+            digest, payload = row
+            raw = zlib.decompress(payload)
+            if hashlib.sha256(raw).hexdigest() != digest:
+                self.logger.warning(f"Discarding corrupt cache entry for match {match_id}")
+                self.conn.execute("DELETE FROM match_details WHERE match_id = ?", (match_id,))
+                self.conn.commit()
+                return None
+
+            self.conn.execute(
+                "UPDATE match_details SET last_access = ? WHERE match_id = ?", (time.time(), match_id)
+            )
+            self.conn.commit()
+        return json.loads(raw)
+
+    def put(self, match_id: str, data: dict):
+        raw = json.dumps(data, separators=(",", ":")).encode("utf-8")
+        payload = zlib.compress(raw)
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO match_details (match_id, digest, payload, size, last_access) VALUES (?, ?, ?, ?, ?)",
+                (match_id, hashlib.sha256(raw).hexdigest(), payload, len(payload), time.time()),
+            )
+            self.evict()
+            self.conn.commit()
+
+    def evict(self):
+        """Drop least recently used entries until the cache fits max_bytes. Caller holds the lock."""
+        total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM match_details").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        rows = self.conn.execute("SELECT match_id, size FROM match_details ORDER BY last_access ASC").fetchall()
+        for match_id, size in rows:
+            if total <= self.max_bytes:
+                break
+            self.conn.execute("DELETE FROM match_details WHERE match_id = ?", (match_id,))
+            total -= size
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
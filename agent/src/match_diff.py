@@ -0,0 +1,94 @@
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional
+
+from models import CurrentMatch, CurrentMatchPlayer, compile_encoder
+
+# Agent field names that the backend stores under a different name
+WIRE_FIELD_NAMES = {"hs_percentage": "hs"}
+
+# Match fields without the roster, which is diffed player by player
+match_fields = compile_encoder(CurrentMatch, exclude=("players",))
+player_fields = compile_encoder(CurrentMatchPlayer, renames=WIRE_FIELD_NAMES)
+
+
+class MatchDiffer:
+    """
+    Last state of a match as sent to the backend.
+    Every update is compared field by field against it and only the fields that changed go out, as a patch
+    with an increasing sequence number. A full snapshot is sent on create, after a reconnect the backend missed
+    updates in, or when the backend asks for one.
+    """
+
+    def __init__(self, match_uuid: str):
+        self.match_uuid = match_uuid
+        self.seq = 0
+        self.fields: Dict[str, Any] = {}
+        # subject -> wire fields of the player
+        self.players: Dict[str, Dict[str, Any]] = {}
+
+    def diff(self, match: CurrentMatch) -> Dict[str, Any]:
+        """
+        Record the match and return the fields that changed since the last call.
+        None values and an empty roster mean "not known on this tick" and never overwrite what was sent.
+        """
+        changes = self.diff_fields(match_fields(match))
+        players = [changed for changed in map(self.diff_player, match.players) if changed]
+        if players:
+            changes["players"] = players
+        return changes
+
+    def diff_fields(self, fields: Dict[str, Any]) -> Dict[str, Any]:
+        """Record the given match fields and return those that changed; fields not given are left as they are."""
+        changes = {}
+        for name, value in fields.items():
+            if value is not None and self.fields.get(name) != value:
+                changes[name] = value
+                self.fields[name] = value
+        return changes
+
+    def diff_player(self, player: CurrentMatchPlayer) -> Optional[Dict[str, Any]]:
+        """Record the player and return its changed fields together with its subject, or None if nothing changed."""
+        previous = self.players.setdefault(player.subject, {})
+        changes = {}
+        for name, value in player_fields(player).items():
+            if value is not None and previous.get(name) != value:
+                changes[name] = value
+                previous[name] = value
+        if not changes:
+            return None
+        return {"subject": player.subject, **changes}
+
+    def patch_message(self, changes: Dict[str, Any]) -> Optional[dict]:
+        if not changes:
+            return None
+        self.seq += 1
+        return {
+            "type": "match_patch",
+            "match_uuid": self.match_uuid,
+            "seq": self.seq,
+            "data": changes,
+            "timestamp": datetime.now(timezone.utc).isoformat()
+        }
+
+    def create_message(self) -> dict:
+        """Full state of the match, telling the backend to (re)create it."""
+        return {**self.snapshot_message(), "type": "match_create"}
+
+    def end_message(self) -> dict:
+        return {
+            "type": "match_end",
+            "match_uuid": self.match_uuid,
+            "seq": self.seq,
+            "data": {"ended_at": datetime.now(timezone.utc).isoformat()},
+            "timestamp": datetime.now(timezone.utc).isoformat()
+        }
+
+    def snapshot_message(self) -> dict:
+        """Full state of the match as of the current sequence number."""
+        return {
+            "type": "match_update",
+            "match_uuid": self.match_uuid,
+            "seq": self.seq,
+            "data": {**self.fields, "players": list(self.players.values())},
+            "timestamp": datetime.now(timezone.utc).isoformat()
+        }
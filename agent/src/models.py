@@ -1,23 +1,64 @@
 import datetime
 from dataclasses import dataclass, field
-from typing import List, Optional
+from typing import Any, Callable, Dict, Iterable, List, Optional, get_args, get_origin, get_type_hints
 import json
 import dataclasses
 
+# Model class -> compiled function returning its fields as a dict
+ENCODERS: Dict[type, Callable[[Any], dict]] = {}
+
+
+def compile_encoder(cls: type, renames: Optional[Dict[str, str]] = None, exclude: Iterable[str] = ()) -> Callable[[Any], dict]:
+    """
+    Generate a function that turns an instance of the dataclass into a dict in one expression.
+    Unlike dataclasses.asdict nothing is deep-copied: plain values are referenced as they are and nested models
+    (or lists of them) are encoded with their own compiled encoder.
+    """
+    renames = renames or {}
+    hints = get_type_hints(cls)
+    namespace = {"ENCODERS": ENCODERS}
+    items = []
+    for f in dataclasses.fields(cls):
+        if f.name in exclude:
+            continue
+        key = repr(renames.get(f.name, f.name))
+        hint = hints[f.name]
+        if get_origin(hint) in (list, List) and dataclasses.is_dataclass(get_args(hint)[0]):
+            items.append(f"{key}: [ENCODERS[type(x)](x) for x in o.{f.name}]")
+        elif dataclasses.is_dataclass(hint):
+            items.append(f"{key}: ENCODERS[type(o.{f.name})](o.{f.name})")
+        else:
+            items.append(f"{key}: o.{f.name}")
+
+    source = f"def encode_{cls.__name__}(o):\n    return {{{', '.join(items)}}}\n"
+    exec(compile(source, f"<encoder {cls.__name__}>", "exec"), namespace)
+    return namespace[f"encode_{cls.__name__}"]
+
+
+def model(cls):
+    """Slotted dataclass with a precompiled encoder registered in ENCODERS."""
+    cls = dataclass(slots=True)(cls)
+    ENCODERS[cls] = compile_encoder(cls)
+    return cls
+
+
 class EnhancedJSONEncoder(json.JSONEncoder):
     def default(self, o):
+        encoder = ENCODERS.get(type(o))
+        if encoder is not None:
+            return encoder(o)
         if dataclasses.is_dataclass(o):
             return dataclasses.asdict(o)
         return super().default(o)
 
 
-@dataclass
+@model
 class CurrentPlayerStats:
     kd: float
     hs: int
     adr: int
 
-@dataclass
+@model
 class Player:
     character: str
     subject: str
@@ -34,7 +75,7 @@ class Player:
     leaderboard_rank: Optional[int] = None
 
 
-@dataclass
+@model
 class CurrentMatchPlayer:
     subject: str
     character: str
@@ -53,7 +94,7 @@ class CurrentMatchPlayer:
     rr: Optional[int] = None
     leaderboard_rank: Optional[int] = None
 
-@dataclass
+@model
 class SingleMatch:
     match_uuid: str
     game_map: str
@@ -62,7 +103,7 @@ class SingleMatch:
     queue_id: str
     players: List[Player] = field(default_factory=list)
 
-@dataclass
+@model
 class CurrentMatch:
     match_uuid: str
     game_map: str
@@ -77,18 +118,18 @@ class CurrentMatch:
     party_owner_enemy_average_rank: Optional[str] = None
     players: List[CurrentMatchPlayer] = field(default_factory=list)
 
-@dataclass
+@model
 class BareMatch:
     match_uuid: str
     game_start: int
     queue_id: str
 
-@dataclass
+@model
 class MatchHistory:
     subject: str
     match_ids: List[BareMatch] = field(default_factory=list)
 
-@dataclass
+@model
 class User:
     puuid: str
     pid: str
@@ -98,4 +139,13 @@ class User:
     region: str
     rank: Optional[str] = None
     rr: Optional[int] = None
-    leaderboard_rank: Optional[int] = None
\ No newline at end of file
+    leaderboard_rank: Optional[int] = None
+
+@model
+class RankRecord:
+    tier: int
+    rr: Optional[int]
+    peak_tier: int
+    season_id: Optional[str]
+    past_peak_tier: int
+    fetched_at: float
@@ -0,0 +1,48 @@
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# How long a player's name is reused before the name service is asked again (names rarely change)
+DEFAULT_TTL_SECONDS = 60 * 60
+# Maximum number of players kept; the least recently used are dropped first
+DEFAULT_MAX_ENTRIES = 1000
+
+
+class NameCache:
+    """
+    In-memory LRU cache of "GameName#TagLine" by puuid.
+    The roster of a match does not change, so after the first lookup every tick of the match is served from here.
+    """
+
+    def __init__(self, ttl_seconds: float = DEFAULT_TTL_SECONDS, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        # puuid -> (name, fetched_at), least recently used first
+        self.names: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+
+    def get(self, puuid: str) -> Optional[str]:
+        entry = self.names.get(puuid)
+        if entry is None:
+            return None
+        if time.time() - entry[1] >= self.ttl_seconds:
+            del self.names[puuid]
+            return None
+        self.names.move_to_end(puuid)
+        return entry[0]
+
+    def get_many(self, puuids: Iterable[str]) -> Tuple[Dict[str, str], List[str]]:
+        """Cached names of the players, and the puuids that still have to be looked up."""
+        found, missing = {}, []
+        for puuid in puuids:
+            name = self.get(puuid)
+            if name is None:
+                missing.append(puuid)
+            else:
+                found[puuid] = name
+        return found, missing
+
+    def put(self, puuid: str, name: str):
+        self.names[puuid] = (name, time.time())
+        self.names.move_to_end(puuid)
+        while len(self.names) > self.max_entries:
+            self.names.popitem(last=False)
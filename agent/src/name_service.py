@@ -1,67 +1,61 @@
-from typing import Any, Dict
-import requests
+from typing import Any
 import constants
+from content_store import ContentStore
+from name_cache import NameCache
 
-params = {"isPlayableCharacter": "true", "language": "en-US"}
-_agents: Dict[str, Dict[str, str]] = {}
+# Agents, maps and tiers; loaded and refreshed at startup, lookups never touch the network
+content = ContentStore()
+# Player names by puuid, so a match's roster is only looked up once
+names = NameCache()
 
 
-def load_agent_data() -> Dict[str, Dict[str, str]]:
-    """Download and cache agent metadata on demand."""
-    if not _agents:
-        data = requests.get("https://valorant-api.com/v1/agents", params=params).json()
-        for a in data.get("data", []):
-            _agents[a["uuid"]] = {
-                "uuid": a["uuid"],
-                "name": a["displayName"],
-                "role": a["role"]["displayName"],
-                "icon": a["displayIcon"],
-            }
-    return _agents
-
 def get_map_name(map_id: str) -> str:
     """
     Get the map name from the map ID.
     """
-    return constants.maps.get(map_id, map_id)
+    return content.map_name(map_id)
 
 def get_agent_name(agent_id: str) -> str:
     """
     Get the agent name from the agent ID.
     """
-    agents = load_agent_data()
-    return agents.get(agent_id, {}).get("name", agent_id)
+    return content.agent_name(agent_id)
 
-def get_name_from_puuid(puuid: str, req) -> dict[str, str | Any] | dict[str, str]:
+async def get_name_from_puuid(puuid: str, req) -> dict[str, str | Any] | dict[str, str]:
     """
     Get the name from the PUUID.
     """
 
-    data = req.fetch("pd", f"/name-service/v2/players/", "put", jsonData=[puuid])
+    data = await req.afetch("pd", f"/name-service/v2/players/", "put", jsonData=[puuid])
     return {"Subject": puuid, "Name": data[0]["GameName"], "Tag": data[0]["TagLine"]} if data else {"Subject": puuid, "Name": "", "Tag": ""}
 
-def get_multiple_names_from_puuid(puuids: list[str], req) -> dict[Any, str]:
+async def get_multiple_names_from_puuid(puuids: list[str], req) -> dict[Any, str]:
     """
     Get the names from multiple PUUIDs.
+    Only players not in the name cache are sent to the name service; if all are cached no request is made.
     """
-    data = req.fetch("pd", f"/name-service/v2/players/", "put", jsonData=puuids)
+    name_dict, missing = names.get_many(puuids)
+    if not missing:
+        return name_dict
 
-    name_dict = {player["Subject"]: f"{player['GameName']}#{player['TagLine']}"
-                     for player in data}
+    data = await req.afetch("pd", f"/name-service/v2/players/", "put", jsonData=missing)
+    for player in data:
+        name = f"{player['GameName']}#{player['TagLine']}"
+        names.put(player["Subject"], name)
+        name_dict[player["Subject"]] = name
     return name_dict
 
 def get_agent_icon(agent_id: str) -> str:
     """
     Get the agent icon from the agent ID.
     """
-    agents = load_agent_data()
-    return agents.get(agent_id, {}).get("icon", "")
+    return content.agent_icon(agent_id)
 
 def get_gamemodes_from_codename(codename:str) -> str:
     return constants.gamemodes.get(codename)
 
 def get_rank_by_id(rank_id: int) -> dict:
-    return constants.ranks.get(rank_id, "Unranked")
+    return content.tier(rank_id) or "Unranked"
 
 def get_rpc_gamemodes(gamemode:str) -> str:
     return constants.rpc_game_modes.get(gamemode, gamemode)
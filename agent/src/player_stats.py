@@ -1,36 +1,126 @@
+import asyncio
 import logging
-import time
+from typing import Dict, Iterable, List, Optional
 
 from req import Requests
 from models import CurrentPlayerStats
-import datetime
+from stats_cache import PlayerStatsCache
+
+# Number of recent competitive matches averaged per player
+RECENT_MATCHES = 5
+# Maximum number of concurrent requests issued by start_stats / get_stats_bulk
+DEFAULT_FETCH_CONCURRENCY = 5
 
 class PlayerStats:
-    def __init__(self, requests: Requests):
+    def __init__(self, requests: Requests, cache: Optional[PlayerStatsCache] = None):
         self.requests = requests
+        self.cache = cache or PlayerStatsCache()
         self.logger = logging.getLogger(__name__)
         self.logger.setLevel(logging.DEBUG)
-        self.last_pull = None
 
-    def get_stats(self, puuid: str) -> CurrentPlayerStats:
-        data = self.requests.fetch("pd",
+    async def get_stats(self, puuid: str) -> CurrentPlayerStats:
+        stats = await self.get_stats_bulk([puuid])
+        return stats[puuid]
+
+    async def get_stats_bulk(self, puuids: List[str], concurrency: int = DEFAULT_FETCH_CONCURRENCY) -> Dict[str, CurrentPlayerStats]:
+        """
+        Get KD/HS/ADR for several players at once.
+        Fresh cached records are used as-is. For the others only matches that are not in their cached window yet are
+        downloaded, each match once for all players, and scanned once for all its subjects.
+        """
+        futures = await self.start_stats(puuids, concurrency)
+        results = await asyncio.gather(*futures.values())
+        return dict(zip(futures.keys(), results))
+
+    async def start_stats(self, puuids: List[str], concurrency: int = DEFAULT_FETCH_CONCURRENCY) -> Dict[str, asyncio.Future]:
+        """
+        Start computing stats for the players and return one future per player.
+        Each future resolves as soon as that player's own matches are in; matches shared between players are
+        downloaded and scanned once for every requested subject.
+        """
+        semaphore = asyncio.Semaphore(max(1, concurrency))
+        subjects = set(puuids)
+        records = await asyncio.to_thread(self.cache.get_many, puuids)
+        # match id -> future with the per-subject stats of that match
+        matches: Dict[str, asyncio.Future] = {}
+
+        async def fetch_match(match_id: str) -> Dict[str, dict]:
+            async with semaphore:
+                data = await self.requests.afetch_match_details(match_id)
+            return self.compute_match_stats(data, subjects, match_id)
+
+        def match_stats(match_id: str) -> asyncio.Future:
+            if match_id not in matches:
+                matches[match_id] = asyncio.ensure_future(fetch_match(match_id))
+            return matches[match_id]
+
+        async def player_stats(puuid: str) -> CurrentPlayerStats:
+            record = records.get(puuid)
+            if record and self.cache.is_fresh(record):
+                return self.average_stats(puuid, record["samples"])
+
+            async with semaphore:
+                match_ids = await self.get_recent_match_ids(puuid)
+            if match_ids is None:
+                # Could not list the player's matches, fall back to whatever window we have
+                return self.average_stats(puuid, record["samples"] if record else [])
+
+            # Matches from the newest one processed last time on are already in the record
+            last_match_id = record["last_match_id"] if record else None
+            new_ids = []
+            for match_id in match_ids:
+                if match_id == last_match_id:
+                    break
+                new_ids.append(match_id)
+
+            known = self.cache.samples_by_match(record)
+            missing = [match_id for match_id in new_ids if match_id not in known]
+            fetched = dict(zip(missing, await asyncio.gather(*(match_stats(match_id) for match_id in missing))))
+
+            samples = []
+            failed = False
+            for match_id in new_ids:
+                stats = known.get(match_id) or fetched.get(match_id, {}).get(puuid)
+                if stats is None:
+                    # Details could not be fetched; skip the match and retry it next time
+                    failed = failed or not fetched.get(match_id)
+                    continue
+                samples.append({"match_id": match_id, "kd": stats["kd"], "hs": stats["hs"], "adr": stats["adr"]})
+            if last_match_id is not None and len(new_ids) < len(match_ids):
+                samples += [sample for sample in record["samples"] if sample["match_id"] not in new_ids]
+            samples = samples[:RECENT_MATCHES]
+
+            if failed:
+                # Keep the old checkpoint and age so the failed matches are fetched again on the next lookup
+                updated = {"last_match_id": last_match_id, "samples": samples,
+                           "updated_at": record["updated_at"] if record else 0}
+            else:
+                updated = {"last_match_id": match_ids[0] if match_ids else last_match_id, "samples": samples}
+            await asyncio.to_thread(self.cache.put_many, {puuid: updated})
+            return self.average_stats(puuid, samples)
+
+        return {puuid: asyncio.ensure_future(player_stats(puuid)) for puuid in puuids}
+
+    async def get_recent_match_ids(self, puuid: str) -> Optional[List[str]]:
+        """Newest-first IDs of the player's recent competitive matches, or None if they could not be fetched."""
+        data = await self.requests.afetch("pd",
                                    f"/mmr/v1/players/{puuid}/competitiveupdates?startIndex=0&endIndex=10&queue=competitive",
                                    "get", retries=3, timeout_sec=2)
+        if data is None:
+            return None
+        return [match["MatchID"] for match in data.get("Matches", [])[0:RECENT_MATCHES] if match]
+
+    def average_stats(self, puuid: str, samples: List[dict]) -> CurrentPlayerStats:
         kd_sum, hs_sum, adr_sum = 0, 0, 0
-        num_games = 0
+        num_games = len(samples)
 
-        for match in data["Matches"][0:5]:
-            if match:
-                match_stats = self.get_match_stats(uuid=match["MatchID"], puuid=puuid)
-                if not match_stats["success"]:
-                    break
-                num_games += 1
-                if match_stats["kd"]:
-                    kd_sum += match_stats["kd"]
-                if match_stats["hs"]:
-                    hs_sum += match_stats["hs"]
-                if match_stats["adr"]:
-                    adr_sum += match_stats["adr"]
+        for match_stats in samples:
+            if match_stats["kd"]:
+                kd_sum += match_stats["kd"]
+            if match_stats["hs"]:
+                hs_sum += match_stats["hs"]
+            if match_stats["adr"]:
+                adr_sum += match_stats["adr"]
 
         if num_games != 0:
             hs = int(hs_sum/num_games)
@@ -50,60 +140,78 @@ class PlayerStats:
                 hs=0
             )
 
-    def get_match_stats(self, uuid: str, puuid: str) -> dict:
-        try:
-            if self.last_pull and datetime.datetime.now() - self.last_pull < datetime.timedelta(seconds=2):
-                time.sleep(2)
-            data = self.requests.fetch("pd", f"/match-details/v1/matches/{uuid}", "get")
-
-            player = None
-
-            for p in data["players"]:
-                if p["subject"] == puuid:
-                    player = p
-                    break
-
-            kd, hs, adr = None, None, None
-
-            kd = round(player["stats"]["kills"] / player["stats"]["deaths"], 1) if player["stats"]["deaths"] != 0 else \
-                player["stats"]["kills"]
-
-            if player["roundDamage"]:
-                damage = 0
-                for r in player["roundDamage"]:
-                    if r["receiver"] != puuid:
-                        damage = damage + r["damage"]
-
-                adr = int(damage / player["stats"]["roundsPlayed"]) if player["stats"]["roundsPlayed"] != 0 else None
-
-            total_hits, total_headshots, kills, deaths = 0, 0, 0, 0
-
-            for r in data.get("roundResults", []):
-                for player in r.get("playerStats", []):
-                    if player["subject"] == puuid:
-                        for hits in player.get("damage", []):
-                            total_hits += (
-                                    hits.get("legshots", 0)
-                                    + hits.get("bodyshots", 0)
-                                    + hits.get("headshots", 0)
-                            )
-                            total_headshots += hits.get("headshots", 0)
-            hs = int((total_headshots / total_hits) * 100) if total_hits else None
-
-            stats = {
-                "success": True,
-                "kd": kd,
-                "hs": hs,
-                "adr": adr
-            }
-
-            return stats
-
-        except Exception as e:
-            self.logger.error(f"Error fetching match stats for {puuid} in match {uuid}: {e}")
-            return {
-                "success": False,
-                "kd": 0,
-                "hs": 0,
-                "adr": 0
-            }
+    def compute_match_stats(self, data: Optional[dict], subjects: Iterable[str], uuid: str = "") -> Dict[str, dict]:
+        """
+        Compute KD/HS/ADR for the given subjects in a single pass over a match-details payload.
+        Subjects that could not be evaluated are left out of the result.
+        """
+        if not data:
+            self.logger.error(f"No match details available for match {uuid}")
+            return {}
+
+        subjects = set(subjects)
+        stats: Dict[str, dict] = {}
+
+        for player in data.get("players", []):
+            puuid = player.get("subject")
+            if puuid not in subjects:
+                continue
+            try:
+                kd = round(player["stats"]["kills"] / player["stats"]["deaths"], 1) if player["stats"]["deaths"] != 0 else \
+                    player["stats"]["kills"]
+
+                adr = None
+                if player["roundDamage"]:
+                    damage = 0
+                    for r in player["roundDamage"]:
+                        if r["receiver"] != puuid:
+                            damage = damage + r["damage"]
+
+                    adr = int(damage / player["stats"]["roundsPlayed"]) if player["stats"]["roundsPlayed"] != 0 else None
+
+                stats[puuid] = {
+                    "success": True,
+                    "kd": kd,
+                    "hs": None,
+                    "adr": adr
+                }
+            except Exception as e:
+                self.logger.error(f"Error computing match stats for {puuid} in match {uuid}: {e}")
+
+        # subject -> [total hits, total headshots]
+        hits_by_subject = {puuid: [0, 0] for puuid in stats}
+
+        for r in data.get("roundResults", []) or []:
+            for player in r.get("playerStats", []) or []:
+                counts = hits_by_subject.get(player.get("subject"))
+                if counts is None:
+                    continue
+                for hits in player.get("damage", []) or []:
+                    counts[0] += (
+                            hits.get("legshots", 0)
+                            + hits.get("bodyshots", 0)
+                            + hits.get("headshots", 0)
+                    )
+                    counts[1] += hits.get("headshots", 0)
+
+        for puuid, (total_hits, total_headshots) in hits_by_subject.items():
+            stats[puuid]["hs"] = int((total_headshots / total_hits) * 100) if total_hits else None
+
+        return stats
+
+    async def get_match_stats(self, uuid: str, puuid: str) -> dict:
+        data = await self.requests.afetch_match_details(uuid)
+
+        stats = self.compute_match_stats(data, [puuid], uuid)
+        if puuid in stats:
+            return stats[puuid]
+
+        return {
+            "success": False,
+            "kd": 0,
+            "hs": 0,
+            "adr": 0
+        }
+
+    def close(self):
+        self.cache.close()
@@ -1,5 +1,6 @@
 from req import Requests
 from user import Users
+from snapshot import TickSnapshot
 from name_service import get_map_name, get_agent_name, get_gamemodes_from_codename
 
 
@@ -8,21 +9,16 @@ class Pregame:
         self.requests = requests
         self.user = user
 
-    def get_pregame_match_id(self):
-        data = self.requests.fetch("glz",f"/pregame/v1/players/{self.user.user.puuid}","get")
+    async def get_pregame_match_id(self, snapshot: TickSnapshot):
+        return await snapshot.pregame_match_id()
 
-        try:
-            return data["MatchID"]
-        except:
-            return None
-
-    def get_pregame_data(self):
-        match_id = self.get_pregame_match_id()
+    async def get_pregame_data(self, snapshot: TickSnapshot):
+        match_id = await self.get_pregame_match_id(snapshot)
         if match_id is None:
             return None
 
         try:
-            data = self.requests.fetch("glz",f"/pregame/v1/matches/{match_id}","get")
+            data = await snapshot.pregame_match()
             player = None
             for p in data["AllyTeam"]["Players"]:
                 if p["Subject"] == self.user.user.puuid:
@@ -39,8 +35,14 @@ class Pregame:
         except:
             return None
 
-    def get_pregame_info(self):
-        data = self.get_pregame_data()
+    async def get_ally_puuids(self, snapshot: TickSnapshot):
+        data = await snapshot.pregame_match()
+        if not data:
+            return []
+        return [p["Subject"] for p in data.get("AllyTeam", {}).get("Players", [])]
+
+    async def get_pregame_info(self, snapshot: TickSnapshot):
+        data = await self.get_pregame_data(snapshot)
         if data is None:
             return None
         ret = {
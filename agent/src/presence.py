@@ -1,6 +1,6 @@
 import base64
+import asyncio
 import json
-import time
 
 
 def decode_presence(private):
@@ -16,12 +16,23 @@ def decode_presence(private):
     }
 
 
+# Presence requests within this many seconds of each other share one response
+PRESENCE_MEMO_TTL = 1.0
+
+
 class Presence:
-    def __init__(self, Requests):
+    def __init__(self, Requests, events=None):
         self.requests = Requests
+        # PresenceEvents feed; presences are polled over HTTP while it is not connected
+        self.events = events
 
-    def get_presence(self):
-        presences = self.requests.fetch(url_type="local", endpoint="/chat/v4/presences", method="get")
+    async def get_presence(self):
+        if self.events is not None:
+            presences = self.events.get_presences()
+            if presences is not None:
+                return presences
+        presences = await self.requests.afetch(url_type="local", endpoint="/chat/v4/presences", method="get",
+                                               memo_ttl=PRESENCE_MEMO_TTL)
         return presences['presences']
 
     def get_game_state(self, presences):
@@ -37,17 +48,17 @@ class Presence:
 
         return None
 
-    def wait_for_presence(self, PlayersPuuids):
+    async def wait_for_presence(self, PlayersPuuids):
         while True:
-            presence = self.get_presence()
+            presence = await self.get_presence()
             for puuid in PlayersPuuids:
                 if puuid not in str(presence):
-                    time.sleep(1)
+                    await asyncio.sleep(1)
                     continue
             break
 
-    def get_party_state(self, party_id: str) -> dict | None:
-        data = self.requests.fetch(url_type="glz", endpoint=f"/parties/v1/parties/{party_id}", method="get")
+    async def get_party_state(self, party_id: str) -> dict | None:
+        data = await self.requests.afetch(url_type="glz", endpoint=f"/parties/v1/parties/{party_id}", method="get")
         # in lobby: party state: STATE: DEFAULT QUEUEID: spikerush QUEUE ENTRY TIME: 2025-08-03T11:03:25.733309Z PREVIOUS STATE: LEAVING_MATCHMAKING
         # in queue: party state: STATE: MATCHMAKING QUEUEID: spikerush QUEUE ENTRY TIME: 2025-08-03T11:05:08.18011333Z PREVIOUS STATE: STARTING_MATCHMAKING
         try:
@@ -65,6 +76,6 @@ class Presence:
                 "queueId": "Normal"
             }
 
-    def get_party(self, uuid: str):
-        party = self.requests.fetch("glz", f"/parties/v1/players/{uuid}", "get")
+    async def get_party(self, uuid: str):
+        party = await self.requests.afetch("glz", f"/parties/v1/players/{uuid}", "get")
         return party["CurrentPartyID"]
@@ -0,0 +1,136 @@
+import asyncio
+import base64
+import json
+import logging
+import os
+import ssl
+from typing import Dict, List, Optional, Tuple
+
+import websockets
+
+from req import Requests
+
+# Local client events we subscribe to: chat presences, and session messages for pregame / core-game changes
+PRESENCE_EVENT = "OnJsonApiEvent_chat_v4_presences"
+SESSION_EVENT = "OnJsonApiEvent_riot-messaging-service_v1_message"
+# URIs of session messages that mean the game state changed
+SESSION_URIS = ("/ares-pregame/", "/ares-core-game/", "/ares-session/")
+# WAMP opcodes used by the local client's event feed
+WAMP_SUBSCRIBE = 5
+WAMP_EVENT = 8
+# Seconds between attempts to (re)connect to the event feed
+RECONNECT_DELAY = 5.0
+
+
+class PresenceEvents:
+    """
+    Subscription to the local Riot client's WebSocket event feed.
+    Keeps every player's presence up to date from chat presence events and signals the agent loop whenever our own
+    presence or session changes. While the feed is down, Presence falls back to polling /chat/v4/presences.
+    The feed URL defaults to wss://127.0.0.1:<lockfile port> and can be pointed elsewhere with RIOT_EVENTS_URL,
+    e.g. at a local stand-in server.
+    """
+
+    def __init__(self, requests: Requests, url: Optional[str] = None):
+        self.requests = requests
+        self.url = url or os.getenv("RIOT_EVENTS_URL")
+        # puuid -> latest presence
+        self.presences: Dict[str, dict] = {}
+        self.connected = False
+        self.changed = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+        self.logger = logging.getLogger(__name__)
+
+    def start(self):
+        if self.task is None:
+            self.task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+
+    def get_presences(self) -> Optional[List[dict]]:
+        """Latest presences from the feed, or None if it is not connected."""
+        if not self.connected:
+            return None
+        return list(self.presences.values())
+
+    async def wait(self, timeout: float) -> bool:
+        """Wait until our presence or session changed, at most timeout seconds; True if something changed."""
+        try:
+            await asyncio.wait_for(self.changed.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            self.changed.clear()
+
+    def _endpoint(self) -> Tuple[str, Dict[str, str], Optional[ssl.SSLContext]]:
+        lockfile = self.requests.lockfile
+        headers = {"Authorization": "Basic " + base64.b64encode(("riot:" + lockfile["password"]).encode()).decode()}
+        url = self.url or f"wss://127.0.0.1:{lockfile['port']}"
+
+        context = None
+        if url.startswith("wss://"):
+            # The local client uses a self-signed certificate
+            context = ssl.create_default_context()
+            context.check_hostname = False
+            context.verify_mode = ssl.CERT_NONE
+        return url, headers, context
+
+    async def _run(self):
+        while True:
+            try:
+                url, headers, context = self._endpoint()
+                async with websockets.connect(url, additional_headers=headers, ssl=context, max_size=None) as ws:
+                    for event in (PRESENCE_EVENT, SESSION_EVENT):
+                        await ws.send(json.dumps([WAMP_SUBSCRIBE, event]))
+
+                    # Events only carry the presences that changed, start from a full list
+                    data = await self.requests.afetch("local", "/chat/v4/presences", "get")
+                    self.presences = {p["puuid"]: p for p in (data or {}).get("presences", [])}
+                    self.connected = True
+                    self.changed.set()
+                    self.logger.info("Subscribed to local client events")
+
+                    async for raw in ws:
+                        self._handle(raw)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.logger.warning(f"Local client event feed unavailable, polling instead: {e}")
+            finally:
+                self.connected = False
+
+            await asyncio.sleep(RECONNECT_DELAY)
+
+    def _handle(self, raw):
+        if not raw:
+            return
+        try:
+            message = json.loads(raw)
+        except json.JSONDecodeError:
+            self.logger.debug(f"Ignoring non-JSON event: {raw}")
+            return
+        if not isinstance(message, list) or len(message) < 3 or message[0] != WAMP_EVENT:
+            return
+
+        event, payload = message[1], message[2] or {}
+        if event == PRESENCE_EVENT:
+            own_changed = False
+            for presence in (payload.get("data") or {}).get("presences", []):
+                puuid = presence.get("puuid")
+                if payload.get("eventType") == "Delete":
+                    self.presences.pop(puuid, None)
+                else:
+                    previous = self.presences.get(puuid)
+                    self.presences[puuid] = presence
+                    if puuid == self.requests.puuid and (previous is None or previous.get("private") != presence.get("private")):
+                        own_changed = True
+            if own_changed:
+                self.changed.set()
+        elif event == SESSION_EVENT:
+            if any(uri in payload.get("uri", "") for uri in SESSION_URIS):
+                self.changed.set()
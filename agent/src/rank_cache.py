@@ -0,0 +1,68 @@
+import time
+from typing import Dict, Optional
+
+import constants
+from models import RankRecord
+
+# How long a player's rank is reused before /mmr is asked again
+DEFAULT_TTL_SECONDS = 5 * 60
+# Tier offset for seasons before Ascendant was added
+BEFORE_ASCENDANT_OFFSET = 3
+
+
+def season_peak(season_id: str, season_data: Optional[dict]) -> int:
+    """Highest tier a player won a game at during the given season, in current tier ids."""
+    wins_by_tier = (season_data or {}).get("WinsByTier")
+    if not wins_by_tier:
+        return 0
+    offset = BEFORE_ASCENDANT_OFFSET if season_id in constants.before_ascendant_seasons else 0
+    return max(int(tier) for tier in wins_by_tier) + offset
+
+
+class RankCache:
+    """
+    In-memory cache of each player's current tier, RR and peak tier.
+    Past seasons never change, so their peak is kept per player and a refresh only looks at the current season.
+    """
+
+    def __init__(self, ttl_seconds: float = DEFAULT_TTL_SECONDS):
+        self.ttl_seconds = ttl_seconds
+        self.records: Dict[str, RankRecord] = {}
+
+    def get(self, puuid: str) -> Optional[RankRecord]:
+        record = self.records.get(puuid)
+        if record and time.time() - record.fetched_at < self.ttl_seconds:
+            return record
+        return None
+
+    def update(self, puuid: str, data: Optional[dict]) -> Optional[RankRecord]:
+        """Store the player's rank from an /mmr/v1/players payload; returns None if the payload is unusable."""
+        if not data:
+            return None
+
+        latest = data["LatestCompetitiveUpdate"]
+        season_id = latest.get("SeasonID") or None
+        seasons = data["QueueSkills"]["competitive"].get("SeasonalInfoBySeasonID") or {}
+
+        previous = self.records.get(puuid)
+        if previous is not None and previous.season_id == season_id:
+            past_peak = previous.past_peak_tier
+        else:
+            past_peak = max(
+                (season_peak(sid, season_data) for sid, season_data in seasons.items() if sid != season_id),
+                default=0,
+            )
+
+        current_peak = season_peak(season_id, seasons.get(season_id)) if season_id else 0
+        tier = latest["TierAfterUpdate"]
+
+        record = RankRecord(
+            tier=tier,
+            rr=latest["RankedRatingAfterUpdate"],
+            peak_tier=max(tier, past_peak, current_peak),
+            season_id=season_id,
+            past_peak_tier=past_peak,
+            fetched_at=time.time(),
+        )
+        self.records[puuid] = record
+        return record
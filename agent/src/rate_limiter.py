@@ -0,0 +1,90 @@
+import asyncio
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+# (requests per second, burst size) a bucket starts with and may grow back to
+DEFAULT_LIMITS: Dict[str, Tuple[float, float]] = {
+    "pd": (10.0, 10.0),
+    "glz": (10.0, 10.0),
+    "custom": (10.0, 10.0),
+}
+# Lowest rate a bucket is slowed down to after repeated 429s
+MIN_RATE = 0.5
+# Rate regained per successful request (additive increase, multiplicative decrease)
+RATE_INCREASE = 0.1
+
+
+class TokenBucket:
+    """
+    Token bucket that adapts to the server: a 429 halves its rate and blocks it for Retry-After seconds,
+    successful requests slowly raise the rate back to its ceiling.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.max_rate = rate
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self) -> float:
+        """Take a token if one is available and return 0, otherwise return how long to wait before trying again."""
+        with self.lock:
+            now = time.monotonic()
+            if now < self.blocked_until:
+                return self.blocked_until - now
+            self._refill(now)
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0
+            return (1 - self.tokens) / self.rate
+
+    async def acquire(self):
+        while (wait := self.reserve()) > 0:
+            await asyncio.sleep(wait)
+
+    def acquire_sync(self):
+        while (wait := self.reserve()) > 0:
+            time.sleep(wait)
+
+    def penalize(self, retry_after: float):
+        with self.lock:
+            now = time.monotonic()
+            self.blocked_until = max(self.blocked_until, now + retry_after)
+            self.rate = max(MIN_RATE, self.rate / 2)
+            self.tokens = 0
+            self.updated = now
+
+    def reward(self):
+        with self.lock:
+            self.rate = min(self.max_rate, self.rate + RATE_INCREASE)
+
+
+class RateLimiter:
+    """Per-host token buckets shared by every caller of Requests."""
+
+    def __init__(self, limits: Optional[Dict[str, Tuple[float, float]]] = None):
+        self.limits = limits or DEFAULT_LIMITS
+        self.buckets: Dict[str, TokenBucket] = {}
+        self.lock = threading.Lock()
+
+    def bucket(self, url_type: str, host: str) -> TokenBucket:
+        with self.lock:
+            if host not in self.buckets:
+                rate, capacity = self.limits.get(url_type, self.limits["custom"])
+                self.buckets[host] = TokenBucket(rate, capacity)
+            return self.buckets[host]
+
+
+def parse_retry_after(value: Optional[str], default: float = 1.0) -> float:
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        return default
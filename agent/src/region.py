@@ -0,0 +1,90 @@
+import json
+import logging
+import mmap
+import os
+import re
+from typing import List, Optional, Tuple
+
+from storage import get_data_path
+
+# Bytes mapped per step while scanning the log backwards
+CHUNK_SIZE = 1024 * 1024
+# Bytes kept from the previous chunk so a URL split across a chunk boundary is still found
+CHUNK_OVERLAP = 4096
+# Hard limit on how much of the log is scanned, newest bytes first
+MAX_SCAN_BYTES = 64 * 1024 * 1024
+
+# pd shard, e.g. "eu" in https://pd.eu.a.pvp.net/account-xp/v1/...
+PD_PATTERN = re.compile(rb"\.([\w-]+)\.a\.pvp\.net/account-xp/v1/")
+# glz region and shard, e.g. "eu-1" and "eu" in https://glz-eu-1.eu.a.pvp.net
+GLZ_PATTERN = re.compile(rb"https://glz-([\w-]+)\.([\w-]+)\.")
+
+logger = logging.getLogger(__name__)
+
+
+def scan_region(log_path: str, max_bytes: int = MAX_SCAN_BYTES) -> Optional[List]:
+    """
+    Find the newest pd shard and glz region in the log by mapping it in chunks from the end.
+    Returns [pd, [glz_region, glz_shard]] like Requests.get_region, or None if either is not in the last max_bytes.
+    """
+    pd: Optional[str] = None
+    glz: Optional[List[str]] = None
+
+    with open(log_path, "rb") as file:
+        size = os.fstat(file.fileno()).st_size
+        if size == 0:
+            return None
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            end = size
+            floor = max(0, size - max_bytes)
+            while end > floor and (pd is None or glz is None):
+                start = max(floor, end - CHUNK_SIZE)
+                chunk = mapped[start:min(size, end + CHUNK_OVERLAP)]
+                if pd is None:
+                    matches = PD_PATTERN.findall(chunk)
+                    if matches:
+                        pd = matches[-1].decode()
+                if glz is None:
+                    matches = GLZ_PATTERN.findall(chunk)
+                    if matches:
+                        glz = [part.decode() for part in matches[-1]]
+                end = start
+
+    if pd is None or glz is None:
+        return None
+    return [pd, glz]
+
+
+def _log_key(log_path: str) -> Tuple[str, int, int]:
+    stat = os.stat(log_path)
+    return os.path.abspath(log_path), stat.st_mtime_ns, stat.st_size
+
+
+def find_region(log_path: str, cache_path: Optional[str] = None) -> List:
+    """
+    Region of the log, from the on-disk cache if the log is unchanged (same mtime and size) since it was scanned.
+    Raises if the region cannot be found in the log.
+    """
+    cache_path = cache_path or get_data_path("region_cache.json")
+    key = list(_log_key(log_path))
+
+    try:
+        with open(cache_path, "r", encoding="utf-8") as f:
+            cached = json.load(f)
+        if cached.get("key") == key:
+            return cached["region"]
+    except (OSError, ValueError):
+        pass
+
+    region = scan_region(log_path)
+    if region is None:
+        raise Exception(f"Region not found in the last {MAX_SCAN_BYTES // (1024 * 1024)} MB of {log_path}")
+
+    try:
+        tmp_path = f"{cache_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"key": key, "region": region}, f)
+        os.replace(tmp_path, cache_path)
+    except OSError as e:
+        logger.warning(f"Could not cache region: {e}")
+    return region
@@ -1,80 +1,133 @@
 import os
 import base64
+import asyncio
+import aiohttp
 import requests
 from os import path
-from typing import Dict
+from typing import Any, Dict, List, Optional, Tuple
 import logging
+import sqlite3
 import time
+import zlib
+
+from contextvars import ContextVar
+from urllib.parse import urlsplit
+
+from match_cache import MatchDetailsCache
+from rate_limiter import RateLimiter, TokenBucket, parse_retry_after
+from region import find_region
+from credentials import CredentialManager
+
+# Connection pool limits for the async client (pd, glz and the local client each get their own keep-alive pool)
+POOL_SIZE = 30
+POOL_SIZE_PER_HOST = 10
+KEEPALIVE_TIMEOUT = 60
+# One-element counter that async requests made in the current context also count into; TickSnapshot sets it in its
+# loaders, so a tick reports only its own requests and not those of background tasks running alongside it
+request_counter: ContextVar[Optional[List[int]]] = ContextVar("request_counter", default=None)
 
 class Requests:
     def __init__(self):
         self.session = requests.Session()
+        self.async_session: Optional[aiohttp.ClientSession] = None
+        self._credentials_lock: Optional[asyncio.Lock] = None
+        self.match_cache = MatchDetailsCache()
+        self.rate_limiter = RateLimiter()
+        # Number of HTTP requests sent so far, used to report per-tick request usage
+        self.request_count = 0
+        # (url_type, endpoint) -> in-flight GET shared by concurrent callers
+        self._inflight: Dict[Tuple[str, str], asyncio.Future] = {}
+        # (url_type, endpoint) -> (monotonic time, response) for callers that accept a short-lived memo
+        self._memo: Dict[Tuple[str, str], Tuple[float, Any]] = {}
         self.lockfile = self.get_lockfile()
-        self.headers: Dict[str, str] = {}
-        self.puuid = ""
-        self.version = self.get_version()
-        self.region = self.get_region()
-        self.pd_url = f"https://pd.{self.region[0]}.a.pvp.net"
-        self.glz_url = f"https://glz-{self.region[1][0]}.{self.region[1][1]}.a.pvp.net"
-        self.region = self.region[0]
+        self.credentials = CredentialManager(self.session, self.lockfile)
+        # Filled in by load_region, which the bootstrap runs concurrently with load_version
+        self.region: Optional[str] = None
+        self.pd_url: Optional[str] = None
+        self.glz_url: Optional[str] = None
         self.logger = logging.getLogger(__name__)
 
+    @property
+    def headers(self) -> Dict[str, str]:
+        return self.credentials.headers
+
+    @property
+    def puuid(self) -> str:
+        return self.credentials.subject
+
+    @property
+    def version(self) -> Optional[str]:
+        return self.credentials.version
+
+    def load_version(self):
+        self.credentials.load_version()
+
+    def load_region(self):
+        region = self.get_region()
+        self.pd_url = f"https://pd.{region[0]}.a.pvp.net"
+        self.glz_url = f"https://glz-{region[1][0]}.{region[1][1]}.a.pvp.net"
+        self.region = region[0]
+
+    def _resolve(self, url_type: str, endpoint: str) -> Optional[Tuple[str, Dict[str, str], bool]]:
+        """Return (url, headers, verify_tls) for a request or None for an unknown url_type."""
+        if url_type == "glz":
+            return self.glz_url + endpoint, self.headers, True
+        if url_type == "pd":
+            return self.pd_url + endpoint, self.headers, True
+        if url_type == "local":
+            local_headers = {
+                "Authorization": "Basic "
+                + base64.b64encode(("riot:" + self.lockfile["password"]).encode()).decode()
+            }
+            return f"https://127.0.0.1:{self.lockfile['port']}{endpoint}", local_headers, False
+        if url_type == "custom":
+            return endpoint, self.headers, True
+        return None
+
+    def _bucket(self, url_type: str, url: str) -> Optional[TokenBucket]:
+        """Rate limit bucket for the request's host; the local client is not rate limited."""
+        if url_type == "local":
+            return None
+        return self.rate_limiter.bucket(url_type, urlsplit(url).netloc)
+
     def fetch(self, url_type: str, endpoint: str, method: str, jsonData=None, retries: int = 3,timeout_sec:float = 5):
         for _ in range(retries):
-            if not self.headers:
-                self.headers = self.get_headers()
+            # The local client authenticates with the lockfile password only
+            if url_type != "local" and not self.credentials.valid:
+                self.credentials.get()
             try:
-                if url_type == "glz":
-                    url = self.glz_url + endpoint
-                    response = self.session.request(
-                        method,
-                        url,
-                        headers=self.headers,
-                        verify=True,
-                        json=jsonData if method.lower() == "put" and jsonData is not None else None,
-                        timeout=timeout_sec
-                    )
-                elif url_type == "pd":
-                    url = self.pd_url + endpoint
-                    response = self.session.request(
-                        method,
-                        url,
-                        headers=self.headers,
-                        verify=True,
-                        json=jsonData if method.lower() == "put" and jsonData is not None else None,
-                        timeout=timeout_sec
-                    )
-                elif url_type == "local":
-                    local_headers = {
-                        "Authorization": "Basic "
-                        + base64.b64encode(("riot:" + self.lockfile["password"]).encode()).decode()
-                    }
-                    url = f"https://127.0.0.1:{self.lockfile['port']}{endpoint}"
-                    response = self.session.request(method, url, headers=local_headers, verify=False)
-                elif url_type == "custom":
-                    url = endpoint
-                    response = self.session.request(
-                        method,
-                        url,
-                        headers=self.headers,
-                        verify=True,
-                        json=jsonData if method.lower() == "put" and jsonData is not None else None,
-                        timeout=timeout_sec
-                    )
-                else:
+                target = self._resolve(url_type, endpoint)
+                if target is None:
                     return None
+                url, headers, verify = target
+                bucket = self._bucket(url_type, url)
+                if bucket:
+                    bucket.acquire_sync()
+                self.request_count += 1
+                response = self.session.request(
+                    method,
+                    url,
+                    headers=headers,
+                    verify=verify,
+                    json=jsonData if method.lower() == "put" and jsonData is not None else None,
+                    timeout=timeout_sec
+                )
 
                 if response.ok:
+                    if bucket:
+                        bucket.reward()
                     return response.json()
                 if response.status_code == 429:
-                    retry_after = int(response.headers.get("Retry-After", 1))
-                    self.logger.warning(f"Rate limit exceeded. Retrying after {retry_after} seconds...")
-                    time.sleep(retry_after)
+                    retry_after = parse_retry_after(response.headers.get("Retry-After"))
+                    self.logger.warning(f"Rate limit exceeded on {url_type}. Slowing down, next attempt in {retry_after} seconds...")
+                    if bucket:
+                        bucket.penalize(retry_after)
                     continue
 
                 if response.status_code in {400, 401, 403}:
-                    self.headers = {}
                     self.logger.error("Authorization failed or bad request. Retrying with new headers...")
+                    if url_type != "local":
+                        self.credentials.refresh(headers)
 
             except requests.RequestException:
                 self.logger.exception(f"Error fetching {url_type} data from {endpoint}. Retrying...")
@@ -84,23 +137,143 @@ class Requests:
         #print(f"Error fetching {url_type} data: {response.status_code} - {response.text}")
         return None
 
+    def _get_async_session(self) -> aiohttp.ClientSession:
+        """Lazily create the pooled aiohttp session; it has to be created inside the running loop."""
+        if self.async_session is None or self.async_session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=POOL_SIZE,
+                limit_per_host=POOL_SIZE_PER_HOST,
+                keepalive_timeout=KEEPALIVE_TIMEOUT,
+                ttl_dns_cache=300,
+            )
+            self.async_session = aiohttp.ClientSession(connector=connector)
+        return self.async_session
+
+    async def _arefresh_headers(self, stale: Optional[Dict[str, str]] = None):
+        """
+        Make sure the Riot auth headers are valid. With stale, the headers a request failed with, they are replaced
+        unless that already happened; concurrent callers share one refresh either way.
+        """
+        if self._credentials_lock is None:
+            self._credentials_lock = asyncio.Lock()
+        async with self._credentials_lock:
+            if stale is not None:
+                await asyncio.to_thread(self.credentials.refresh, stale)
+            elif not self.credentials.valid:
+                await asyncio.to_thread(self.credentials.get)
+
+    async def load_headers(self):
+        """Fetch the Riot auth headers ahead of the first pd / glz request and keep them refreshed from then on."""
+        await self._arefresh_headers()
+        self.credentials.start()
+
+    async def afetch(self, url_type: str, endpoint: str, method: str, jsonData=None, retries: int = 3, timeout_sec: float = 5,
+                     memo_ttl: float = 0):
+        """
+        Async counterpart of fetch.
+        Requests share one keep-alive connection pool per host, so concurrent callers don't block the event loop.
+        Riot hosts are paced by a shared per-host token bucket that backs off on 429 responses.
+        Concurrent GETs for the same (url_type, endpoint) share a single request, and with memo_ttl > 0 a response
+        younger than memo_ttl seconds is reused. Shared responses must be treated as read-only.
+        """
+        if method.lower() != "get":
+            return await self._afetch(url_type, endpoint, method, jsonData, retries, timeout_sec)
+
+        key = (url_type, endpoint)
+        if memo_ttl > 0:
+            memo = self._memo.get(key)
+            if memo and time.monotonic() - memo[0] < memo_ttl:
+                return memo[1]
+
+        future = self._inflight.get(key)
+        if future is None:
+            future = asyncio.ensure_future(self._afetch(url_type, endpoint, method, jsonData, retries, timeout_sec))
+            self._inflight[key] = future
+            future.add_done_callback(lambda done: self._inflight.pop(key) if self._inflight.get(key) is done else None)
+
+        # Shielded so a cancelled caller doesn't cancel the request for everyone else
+        data = await asyncio.shield(future)
+        if memo_ttl > 0 and data is not None:
+            self._memo[key] = (time.monotonic(), data)
+        return data
+
+    async def _afetch(self, url_type: str, endpoint: str, method: str, jsonData=None, retries: int = 3, timeout_sec: float = 5):
+        session = self._get_async_session()
+        for _ in range(retries):
+            if url_type != "local" and not self.credentials.valid:
+                await self._arefresh_headers()
+            target = self._resolve(url_type, endpoint)
+            if target is None:
+                return None
+            url, headers, verify = target
+            bucket = self._bucket(url_type, url)
+            if bucket:
+                await bucket.acquire()
+            self.request_count += 1
+            counter = request_counter.get()
+            if counter is not None:
+                counter[0] += 1
+            try:
+                async with session.request(
+                    method.upper(),
+                    url,
+                    headers=headers,
+                    ssl=verify,
+                    json=jsonData if method.lower() == "put" and jsonData is not None else None,
+                    timeout=aiohttp.ClientTimeout(total=timeout_sec),
+                ) as response:
+                    if response.ok:
+                        if bucket:
+                            bucket.reward()
+                        return await response.json(content_type=None)
+                    if response.status == 429:
+                        retry_after = parse_retry_after(response.headers.get("Retry-After"))
+                        self.logger.warning(f"Rate limit exceeded on {url_type}. Slowing down, next attempt in {retry_after} seconds...")
+                        if bucket:
+                            bucket.penalize(retry_after)
+                        continue
+
+                    if response.status in {400, 401, 403}:
+                        self.logger.error("Authorization failed or bad request. Retrying with new headers...")
+                        if url_type != "local":
+                            await self._arefresh_headers(headers)
+
+            # ValueError: a 2xx response whose body is not JSON, retried like the sync path does
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError):
+                self.logger.exception(f"Error fetching {url_type} data from {endpoint}. Retrying...")
+
+        return None
+
+    async def afetch_match_details(self, match_id: str) -> Optional[dict]:
+        """Fetch a match-details payload, serving finished matches from the on-disk cache."""
+        try:
+            cached = await asyncio.to_thread(self.match_cache.get, match_id)
+            if cached is not None:
+                return cached
+        except (sqlite3.Error, zlib.error, ValueError):
+            self.logger.exception(f"Error reading match {match_id} from the cache")
+
+        data = await self.afetch("pd", f"/match-details/v1/matches/{match_id}", "get")
+        if data and data.get("matchInfo", {}).get("isCompleted", True):
+            try:
+                await asyncio.to_thread(self.match_cache.put, match_id, data)
+            except sqlite3.Error:
+                self.logger.exception(f"Error writing match {match_id} to the cache")
+        return data
+
+    async def close(self):
+        """Close the pooled async connections and the local caches."""
+        await self.credentials.close()
+        if self.async_session is not None and not self.async_session.closed:
+            await self.async_session.close()
+        self.match_cache.close()
+
     def get_version(self):
-        data = self.session.get('https://valorant-api.com/v1/version', verify=True)
-        version = data.json()
-        return version["data"]["riotClientVersion"]
+        return self.version or self.credentials.load_version()
 
     def get_region(self):
         path = os.path.join(os.getenv('LOCALAPPDATA'), R'VALORANT\Saved\Logs\ShooterGame.log')
-        with open(path, "r", encoding="utf8") as file:
-            while True:
-                line = file.readline()
-                if '.a.pvp.net/account-xp/v1/' in line:
-                    pd_url = line.split('.a.pvp.net/account-xp/v1/')[0].split('.')[-1]
-                elif 'https://glz' in line:
-                    glz_url = [(line.split('https://glz-')[1].split(".")[0]),
-                               (line.split('https://glz-')[1].split(".")[1])]
-                if "pd_url" in locals().keys() and "glz_url" in locals().keys():
-                    return [pd_url, glz_url]
+        return find_region(path)
 
     def get_lockfile(self):
         try:
@@ -115,22 +288,4 @@ class Requests:
             raise Exception("Lockfile not found, you are not in-game!")
 
     def get_headers(self):
-
-        localAuthorization = {
-            f'Authorization': 'Basic ' + base64.b64encode(('riot:' + self.lockfile["password"]).encode()).decode()}
-
-        data = self.session.get(
-            f'https://127.0.0.1:{self.lockfile["port"]}/entitlements/v1/token',
-            headers=localAuthorization,
-            verify=False,
-        )
-        entitlements = data.json()
-        self.puuid = entitlements["subject"]
-        headers = {
-            'Authorization': f"Bearer {entitlements['accessToken']}",
-            'X-Riot-Entitlements-JWT': entitlements['token'],
-            'X-Riot-ClientPlatform': "ew0KCSJwbGF0Zm9ybVR5cGUiOiAiUEMiLA0KCSJwbGF0Zm9ybU9TIjogIldpbmRvd3MiLA0KCSJwbGF0Zm9ybU9TVmVyc2lvbiI6ICIxMC4wLjE5MDQyLjEuMjU2LjY0Yml0IiwNCgkicGxhdGZvcm1DaGlwc2V0IjogIlVua25vd24iDQp9",
-            'X-Riot-ClientVersion': self.get_version(),
-            "User-Agent": "ShooterGame/13 Windows/10.0.19043.1.256.64bit"
-        }
-        return headers
\ No newline at end of file
+        return self.credentials.get()
@@ -0,0 +1,83 @@
+import asyncio
+import time
+from typing import Any, Dict, Optional, Tuple
+
+# Seconds between ticks per game state
+STATE_INTERVALS = {"MENUS": 8.0, "PREGAME": 2.0, "INGAME": 2.0}
+# Seconds between ticks in any other state, e.g. while the client is not running
+DEFAULT_INTERVAL = 10.0
+# The interval grows by this factor after every tick that changed nothing...
+BACKOFF_FACTOR = 1.5
+# ...up to this many times the state's interval
+MAX_BACKOFF = 4.0
+# Seconds a source of TickSnapshot is reused across ticks; sources not listed are fetched every tick
+SOURCE_INTERVALS = {
+    "core_game_match_id": 30.0,
+    "core_game_match": 10.0,
+    "pregame_match_id": 30.0,
+    "party_id": 30.0,
+}
+
+
+class PollScheduler:
+    """
+    Decides when the agent loop ticks next.
+    Every game state has its own interval, which backs off while ticks keep seeing the same data and snaps back as
+    soon as something changes. Ticks are scheduled by deadline, so a slow tick shortens the wait after it instead of
+    pushing every later tick back.
+    Slow-changing sources of TickSnapshot are also kept for SOURCE_INTERVALS across ticks of the same state.
+    """
+
+    def __init__(self):
+        self.state: Optional[str] = None
+        self.fingerprint: Any = None
+        self.idle_ticks = 0
+        self.deadline = time.monotonic()
+        # source -> (expiry, future of its value)
+        self.sources: Dict[str, Tuple[float, asyncio.Future]] = {}
+
+    @property
+    def interval(self) -> float:
+        base = STATE_INTERVALS.get(self.state, DEFAULT_INTERVAL)
+        return min(base * BACKOFF_FACTOR ** self.idle_ticks, base * MAX_BACKOFF)
+
+    def get_source(self, key: str) -> Optional[asyncio.Future]:
+        entry = self.sources.get(key)
+        if entry is None:
+            return None
+        expiry, future = entry
+        failed = future.done() and (future.cancelled() or future.exception() is not None or future.result() is None)
+        if failed or time.monotonic() > expiry:
+            # Errors and missing data are retried on the next tick
+            del self.sources[key]
+            return None
+        return future
+
+    def put_source(self, key: str, future: asyncio.Future):
+        if key in SOURCE_INTERVALS:
+            self.sources[key] = (time.monotonic() + SOURCE_INTERVALS[key], future)
+
+    def tick_done(self, state: Optional[str], fingerprint: Any = None) -> float:
+        """Record what the tick saw and return the seconds to wait until the next one."""
+        if state != self.state:
+            # Data of the previous state (match ids, parties) is stale now
+            self.state = state
+            self.idle_ticks = 0
+            self.sources.clear()
+        elif fingerprint != self.fingerprint:
+            self.idle_ticks = 0
+        else:
+            self.idle_ticks += 1
+        self.fingerprint = fingerprint
+
+        now = time.monotonic()
+        self.deadline += self.interval
+        if self.deadline < now:
+            # Running behind: tick right away rather than bursting through the missed deadlines
+            self.deadline = now
+        return self.deadline - now
+
+    def woken(self):
+        """The next tick was started early by an event; schedule from now."""
+        self.deadline = time.monotonic()
+        self.idle_ticks = 0
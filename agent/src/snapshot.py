@@ -0,0 +1,108 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from req import Requests, request_counter
+from presence import Presence, decode_presence
+from scheduler import PollScheduler
+
+
+class TickSnapshot:
+    """
+    State of the Riot client for a single agent tick.
+    Every piece of data is fetched lazily on first use and memoized, so each endpoint is hit at most once per tick
+    no matter how many of Match, Pregame, Presence and DiscordRPC read it.
+    With a scheduler, slow-changing data is reused from earlier ticks until its source interval passed.
+    """
+
+    def __init__(self, requests: Requests, presence: Presence, puuid: str, scheduler: Optional[PollScheduler] = None):
+        self.requests = requests
+        self.presence = presence
+        self.puuid = puuid
+        self.scheduler = scheduler
+        self._values: Dict[str, asyncio.Future] = {}
+        # Requests made by the loaders of this snapshot (see req.request_counter)
+        self._calls = [0]
+
+    @property
+    def calls(self) -> int:
+        """Number of HTTP requests the snapshot's own loaders issued; data reused from earlier ticks costs none."""
+        return self._calls[0]
+
+    async def _counted(self, loader: Callable[[], Awaitable[Any]]) -> Any:
+        # Runs as its own task, so the counter is only seen by this loader and the requests it starts
+        request_counter.set(self._calls)
+        return await loader()
+
+    async def _memo(self, key: str, loader: Callable[[], Awaitable[Any]]) -> Any:
+        if key not in self._values:
+            future = self.scheduler.get_source(key) if self.scheduler else None
+            if future is None:
+                future = asyncio.ensure_future(self._counted(loader))
+                if self.scheduler:
+                    self.scheduler.put_source(key, future)
+            self._values[key] = future
+        return await asyncio.shield(self._values[key])
+
+    async def presences(self) -> Optional[list]:
+        return await self._memo("presences", self.presence.get_presence)
+
+    async def private_presence(self) -> Optional[dict]:
+        async def load():
+            presences = await self.presences()
+            return self.presence.get_private_presence(presences) if presences else None
+
+        return await self._memo("private_presence", load)
+
+    async def party_presence(self) -> dict:
+        return decode_presence(await self.private_presence())
+
+    async def game_state(self) -> Optional[str]:
+        private = await self.private_presence()
+        return private.get("sessionLoopState") if private else None
+
+    async def party_id(self) -> Optional[str]:
+        async def load():
+            private = await self.private_presence()
+            if private and private.get("partyId"):
+                return private["partyId"]
+            return await self.presence.get_party(self.puuid)
+
+        return await self._memo("party_id", load)
+
+    async def party_state(self) -> dict:
+        async def load():
+            return await self.presence.get_party_state(await self.party_id())
+
+        return await self._memo("party_state", load)
+
+    async def pregame_match_id(self) -> Optional[str]:
+        async def load():
+            data = await self.requests.afetch("glz", f"/pregame/v1/players/{self.puuid}", "get")
+            return data.get("MatchID") if data else None
+
+        return await self._memo("pregame_match_id", load)
+
+    async def pregame_match(self) -> Optional[dict]:
+        async def load():
+            match_id = await self.pregame_match_id()
+            if match_id is None:
+                return None
+            return await self.requests.afetch("glz", f"/pregame/v1/matches/{match_id}", "get")
+
+        return await self._memo("pregame_match", load)
+
+    async def core_game_match_id(self) -> Optional[str]:
+        async def load():
+            data = await self.requests.afetch("glz", f"/core-game/v1/players/{self.puuid}", "get")
+            return data.get("MatchID") if data else None
+
+        return await self._memo("core_game_match_id", load)
+
+    async def core_game_match(self) -> Optional[dict]:
+        async def load():
+            match_id = await self.core_game_match_id()
+            if match_id is None:
+                return None
+            return await self.requests.afetch("glz", f"/core-game/v1/matches/{match_id}", "get")
+
+        return await self._memo("core_game_match", load)
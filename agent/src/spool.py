@@ -0,0 +1,175 @@
+import json
+import logging
+import os
+import threading
+from typing import Dict, Iterable, List, Optional
+
+from models import EnhancedJSONEncoder
+from storage import get_data_path
+
+# Journal entries kept before the file is rewritten with only the latest state per match
+MAX_JOURNAL_ENTRIES = 1000
+
+
+def compact_messages(messages: List[dict]) -> List[dict]:
+    """
+    Fold a sequence of agent messages into the latest state per match, in order of first appearance.
+    A match that ended is reduced to its end message; a match created in the sequence becomes one match_create with
+    its full state, otherwise one match_update carrying every field that changed, with the newest seq.
+    """
+    # match_uuid -> {"type", "seq", "fields", "players", "end"}
+    states: Dict[str, dict] = {}
+
+    for message in messages:
+        for entry in message["messages"] if message["type"] == "batch" else [message]:
+            match_uuid = entry["match_uuid"]
+            if entry["type"] == "match_end":
+                states[match_uuid] = {"end": entry}
+                continue
+
+            state = states.get(match_uuid)
+            if state is None or "end" in state or entry["type"] == "match_create":
+                state = states[match_uuid] = {
+                    "type": "match_create" if entry["type"] == "match_create" else "match_update",
+                    "seq": 0,
+                    "fields": {},
+                    "players": {},
+                }
+
+            data = dict(entry.get("data") or {})
+            for player in data.pop("players", []) or []:
+                state["players"].setdefault(player["subject"], {}).update(player)
+            state["fields"].update(data)
+            state["seq"] = max(state["seq"], entry.get("seq") or 0)
+
+    compacted = []
+    for match_uuid, state in states.items():
+        if "end" in state:
+            compacted.append(state["end"])
+            continue
+        compacted.append({
+            "type": state["type"],
+            "match_uuid": match_uuid,
+            "seq": state["seq"],
+            "data": {**state["fields"], "players": list(state["players"].values())},
+        })
+    return compacted
+
+
+class UpdateSpool:
+    """
+    Append-only on-disk journal of the messages queued for the backend.
+    Lines are written as they are queued and fsynced in batches by sync(). The journal is truncated once the
+    backend acknowledged everything, so after a crash or restart whatever was left is replayed.
+    append() runs on the event loop, so sync() and compact(), which run in a worker thread, hold the lock only for
+    bookkeeping and never across an fsync or a rewrite of the whole journal.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or get_data_path("agent_spool.jsonl")
+        self.lock = threading.Lock()
+        self.entries = 0
+        self.dirty = False
+        # Bumped by reset(), so a compaction running meanwhile knows its copy is stale
+        self.generation = 0
+        self.file = open(self.path, "a", encoding="utf-8")
+        self.logger = logging.getLogger(__name__)
+
+    def _parse(self, lines: Iterable[str]) -> List[dict]:
+        messages = []
+        for line in lines:
+            try:
+                messages.append(json.loads(line))
+            except json.JSONDecodeError:
+                # Torn write of the last line before a crash
+                self.logger.warning(f"Skipping unreadable spool entry in {self.path}")
+        return messages
+
+    def load(self) -> List[dict]:
+        """Messages left over from a previous run, compacted to the latest state per match."""
+        with self.lock:
+            with open(self.path, "r", encoding="utf-8") as f:
+                messages = self._parse(f)
+            self.entries = len(messages)
+        return compact_messages(messages)
+
+    @property
+    def full(self) -> bool:
+        """The journal has grown past MAX_JOURNAL_ENTRIES and should be compacted."""
+        return self.entries > MAX_JOURNAL_ENTRIES
+
+    def append(self, message: dict):
+        with self.lock:
+            self.file.write(json.dumps(message, cls=EnhancedJSONEncoder) + "\n")
+            self.file.flush()
+            self.entries += 1
+            self.dirty = True
+
+    def sync(self):
+        """fsync everything appended since the last call."""
+        with self.lock:
+            if not self.dirty:
+                return
+            # fsync a duplicate of the descriptor, so appends (and a rewrite swapping the file) can go on meanwhile
+            fd = os.dup(self.file.fileno())
+            self.dirty = False
+        try:
+            os.fsync(fd)
+        except OSError:
+            with self.lock:
+                self.dirty = True
+            raise
+        finally:
+            os.close(fd)
+
+    def reset(self):
+        """Forget every entry, the backend has applied them all."""
+        with self.lock:
+            if self.entries:
+                self.file.truncate(0)
+                self.entries = 0
+                self.dirty = True
+                self.generation += 1
+
+    def compact(self):
+        """
+        Rewrite the journal with only the latest state per match.
+        The journal as it was when the call started is compacted without the lock; entries appended meanwhile are
+        copied over as they are, under the lock, before the rewritten file replaces the journal.
+        """
+        with self.lock:
+            size = os.fstat(self.file.fileno()).st_size
+            generation = self.generation
+        with open(self.path, "rb") as f:
+            compacted = compact_messages(self._parse(f.read(size).decode("utf-8", errors="replace").splitlines()))
+
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for message in compacted:
+                f.write(json.dumps(message, cls=EnhancedJSONEncoder) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+        with self.lock:
+            if generation != self.generation or self.file.closed:
+                # Everything was acknowledged (or the spool closed) meanwhile, the compacted copy is stale
+                os.remove(tmp_path)
+                return
+            with open(self.path, "rb") as f:
+                f.seek(size)
+                tail = f.read()
+            with open(tmp_path, "ab") as f:
+                f.write(tail)
+            os.replace(tmp_path, self.path)
+
+            self.file.close()
+            self.file = open(self.path, "a", encoding="utf-8")
+            self.entries = len(compacted) + tail.count(b"\n")
+            # The copied entries were not fsynced as part of the new file
+            self.dirty = bool(tail)
+
+    def close(self):
+        with self.lock:
+            if self.dirty:
+                os.fsync(self.file.fileno())
+            self.file.close()
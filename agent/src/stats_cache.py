@@ -0,0 +1,86 @@
+import json
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, Optional
+
+from storage import get_data_path
+
+# A record younger than this is used without asking Riot for newer matches
+DEFAULT_FRESH_SECONDS = 10 * 60
+
+
+class PlayerStatsCache:
+    """
+    Persistent per-player stats records.
+    Each record holds the KD/HS/ADR samples of the player's recent matches (newest first) and the newest
+    MatchID already processed, so later lookups only need to process matches played since then.
+    """
+
+    def __init__(self, path: Optional[str] = None, fresh_seconds: float = DEFAULT_FRESH_SECONDS):
+        self.path = path or get_data_path("player_stats.sqlite3")
+        self.fresh_seconds = fresh_seconds
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS player_stats (
+                puuid TEXT PRIMARY KEY,
+                last_match_id TEXT,
+                samples TEXT NOT NULL,
+                updated_at REAL NOT NULL
+            )
+            """
+        )
+        self.conn.commit()
+
+    def get_many(self, puuids: Iterable[str]) -> Dict[str, dict]:
+        puuids = list(puuids)
+        if not puuids:
+            return {}
+
+        placeholders = ",".join("?" for _ in puuids)
+        with self.lock:
+            rows = self.conn.execute(
+                f"SELECT puuid, last_match_id, samples, updated_at FROM player_stats WHERE puuid IN ({placeholders})",
+                puuids,
+            ).fetchall()
+
+        return {
+            puuid: {
+                "last_match_id": last_match_id,
+                "samples": json.loads(samples),
+                "updated_at": updated_at,
+            }
+            for puuid, last_match_id, samples, updated_at in rows
+        }
+
+    def put_many(self, records: Dict[str, dict]):
+        """Store the records, stamped with the current time unless a record carries its own updated_at."""
+        if not records:
+            return
+
+        now = time.time()
+        with self.lock:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO player_stats (puuid, last_match_id, samples, updated_at) VALUES (?, ?, ?, ?)",
+                [
+                    (puuid, record["last_match_id"], json.dumps(record["samples"]), record.get("updated_at", now))
+                    for puuid, record in records.items()
+                ],
+            )
+            self.conn.commit()
+
+    def is_fresh(self, record: dict) -> bool:
+        return time.time() - record["updated_at"] < self.fresh_seconds
+
+    @staticmethod
+    def samples_by_match(record: Optional[dict]) -> Dict[str, dict]:
+        if not record:
+            return {}
+        return {sample["match_id"]: sample for sample in record["samples"]}
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
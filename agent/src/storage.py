@@ -0,0 +1,20 @@
+import os
+
+APP_DIR_NAME = "ValorantPerformanceTracker"
+
+
+def get_data_dir() -> str:
+    """
+    Directory for the agent's local caches.
+    Defaults to %LOCALAPPDATA%\\ValorantPerformanceTracker and can be overridden with VPT_DATA_DIR.
+    """
+    data_dir = os.getenv("VPT_DATA_DIR")
+    if not data_dir:
+        base = os.getenv("LOCALAPPDATA") or os.path.join(os.path.expanduser("~"), ".cache")
+        data_dir = os.path.join(base, APP_DIR_NAME)
+    os.makedirs(data_dir, exist_ok=True)
+    return data_dir
+
+
+def get_data_path(filename: str) -> str:
+    return os.path.join(get_data_dir(), filename)
@@ -1,16 +1,26 @@
+from typing import Optional
+
 from req import Requests
 from models import User
 
 
 class Users:
-    def __init__(self, requests: Requests):
+    def __init__(self, requests: Requests, user: Optional[User] = None):
         self.requests = requests
-        self.user = self.get_user()
+        self.user = user or self.get_user()
         self.loadout = ""
 
+    @classmethod
+    async def create(cls, requests: Requests) -> "Users":
+        session = await requests.afetch("local", "/chat/v1/session", "get")
+        return cls(requests, cls.user_from_session(session))
+
     def get_user(self)-> User:
         session = self.requests.fetch("local","/chat/v1/session","get")
+        return self.user_from_session(session)
 
+    @staticmethod
+    def user_from_session(session: dict) -> User:
         user = User(
             puuid=session["puuid"],
             pid=session["pid"],
@@ -0,0 +1,63 @@
+import zlib
+from typing import Any, Dict, List, Union
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+# Frames at least this large are compressed when the encoding allows it
+COMPRESS_MIN_BYTES = 512
+# First byte of a binary frame
+FLAG_PLAIN = 0
+FLAG_ZLIB = 1
+
+# Keys sent as their index instead of their name; append only, the order is part of the protocol
+KEYS: List[str] = [
+    "type", "id", "match_uuid", "seq", "data", "timestamp", "messages", "players",
+    "game_map", "game_start", "game_mode", "state", "party_owner_score", "party_owner_enemy_score", "party_size",
+    "party_owner_team_id", "party_owner_average_rank", "party_owner_enemy_average_rank", "ended_at",
+    "subject", "character", "team_id", "game_name", "account_level", "player_card_id", "player_title_id",
+    "preferred_level_border_id", "agent_icon", "rank", "peak_rank", "rr", "leaderboard_rank", "kd", "hs", "adr",
+]
+KEY_IDS: Dict[str, int] = {key: i for i, key in enumerate(KEYS)}
+
+# Binary encodings we can speak on /ws/agent, most preferred first; must match backend/app/wire.py.
+# The names carry the size of KEYS, so peers with different key dictionaries never agree on one and use JSON
+ENCODINGS = [f"msgpack+zlib/v{len(KEYS)}", f"msgpack/v{len(KEYS)}"]
+
+
+def available_encodings() -> List[str]:
+    return ENCODINGS if msgpack is not None else []
+
+
+def _pack_keys(value: Any) -> Any:
+    if isinstance(value, dict):
+        return {KEY_IDS.get(k, k): _pack_keys(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_pack_keys(v) for v in value]
+    return value
+
+
+def _unpack_keys(value: Any) -> Any:
+    if isinstance(value, dict):
+        # Ids beyond our dictionary are kept as they are rather than failing the whole frame
+        return {KEYS[k] if isinstance(k, int) and 0 <= k < len(KEYS) else k: _unpack_keys(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_unpack_keys(v) for v in value]
+    return value
+
+
+def encode(message: dict, encoding: str) -> bytes:
+    """MessagePack frame with dictionary-coded keys, zlib-compressed when large enough and allowed."""
+    payload = msgpack.packb(_pack_keys(message), use_bin_type=True)
+    if encoding.startswith("msgpack+zlib/") and len(payload) >= COMPRESS_MIN_BYTES:
+        return bytes([FLAG_ZLIB]) + zlib.compress(payload)
+    return bytes([FLAG_PLAIN]) + payload
+
+
+def decode(frame: Union[bytes, bytearray]) -> dict:
+    payload = bytes(frame[1:])
+    if frame[0] == FLAG_ZLIB:
+        payload = zlib.decompress(payload)
+    return _unpack_keys(msgpack.unpackb(payload, raw=False, strict_map_key=False))
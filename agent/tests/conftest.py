@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The agent runs from agent/src with flat imports
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, "src"))
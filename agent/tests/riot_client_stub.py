@@ -0,0 +1,67 @@
+"""Local stand-in for the Riot client's WebSocket event feed, which PresenceEvents reaches via RIOT_EVENTS_URL."""
+import asyncio
+import base64
+import json
+from typing import List
+
+import websockets
+
+from presence_events import PRESENCE_EVENT, WAMP_EVENT, WAMP_SUBSCRIBE
+
+
+def presence(puuid: str, state: str) -> dict:
+    """A chat presence as the local client sends it, with the private part base64 encoded."""
+    private = {"isValid": True, "sessionLoopState": state, "partyId": "party", "partySize": 1}
+    return {"puuid": puuid, "product": "valorant", "private": base64.b64encode(json.dumps(private).encode()).decode()}
+
+
+class RiotClientStub:
+    """Accepts agents with the lockfile password, records their subscriptions and emits WAMP events to them."""
+
+    def __init__(self, password: str = "stub"):
+        self.password = password
+        self.subscriptions: List[str] = []
+        self.connections = []
+        self.connected = asyncio.Event()
+        self.server = None
+
+    @property
+    def url(self) -> str:
+        return f"ws://127.0.0.1:{self.server.sockets[0].getsockname()[1]}"
+
+    async def start(self, port: int = 0):
+        self.server = await websockets.serve(self._handle, "127.0.0.1", port)
+
+    async def close(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def _handle(self, ws):
+        expected = "Basic " + base64.b64encode(f"riot:{self.password}".encode()).decode()
+        if ws.request.headers.get("Authorization") != expected:
+            await ws.close(code=4001, reason="unauthorized")
+            return
+        self.connections.append(ws)
+        try:
+            async for raw in ws:
+                message = json.loads(raw)
+                if message[0] == WAMP_SUBSCRIBE:
+                    self.subscriptions.append(message[1])
+                    self.connected.set()
+        finally:
+            self.connections.remove(ws)
+
+    async def emit(self, event: str, payload: dict):
+        for ws in list(self.connections):
+            await ws.send(json.dumps([WAMP_EVENT, event, payload]))
+
+    async def set_presence(self, puuid: str, state: str, event_type: str = "Update"):
+        await self.emit(PRESENCE_EVENT, {"data": {"presences": [presence(puuid, state)]}, "eventType": event_type,
+                                         "uri": "/chat/v4/presences"})
+
+    async def drop(self):
+        """Close every connection, as the client does when it restarts."""
+        self.connected.clear()
+        for ws in list(self.connections):
+            await ws.close()
+
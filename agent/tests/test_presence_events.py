@@ -0,0 +1,105 @@
+import asyncio
+import json
+
+import presence_events
+from presence import Presence
+from presence_events import SESSION_EVENT, PresenceEvents
+from riot_client_stub import RiotClientStub, presence
+from snapshot import TickSnapshot
+
+PUUID = "me"
+
+
+class FakeRequests:
+    """Serves /chat/v4/presences the way polling sees it and counts how often it was polled."""
+
+    def __init__(self, password: str):
+        self.lockfile = {"port": "0", "password": password}
+        self.puuid = PUUID
+        self.request_count = 0
+        self.state = "MENUS"
+
+    async def afetch(self, url_type, endpoint, method, **kwargs):
+        assert (url_type, endpoint) == ("local", "/chat/v4/presences")
+        self.request_count += 1
+        return {"presences": [presence(PUUID, self.state), presence("friend", "INGAME")]}
+
+
+async def game_state(requests, p) -> str:
+    return await TickSnapshot(requests, p, PUUID).game_state()
+
+
+async def run_feed(test):
+    stub = RiotClientStub(password="secret")
+    await stub.start()
+    requests = FakeRequests("secret")
+    events = PresenceEvents(requests, url=stub.url)
+    try:
+        await test(stub, requests, events, Presence(requests, events))
+    finally:
+        await events.close()
+        await stub.close()
+
+
+def test_events_drive_state_and_polling_is_the_fallback(monkeypatch):
+    monkeypatch.setattr(presence_events, "RECONNECT_DELAY", 0.05)
+
+    async def test(stub, requests, events, p):
+        # Not connected yet: presence is polled
+        assert await game_state(requests, p) == "MENUS"
+        assert requests.request_count == 1
+
+        events.start()
+        await asyncio.wait_for(stub.connected.wait(), 2)
+        assert await events.wait(2)
+        assert stub.subscriptions == [presence_events.PRESENCE_EVENT, SESSION_EVENT]
+        seeded = requests.request_count
+
+        # Friends changing presence don't wake the loop, our own presence does and is served without polling
+        await stub.set_presence("friend", "MENUS")
+        assert not await events.wait(0.2)
+        await stub.set_presence(PUUID, "PREGAME")
+        assert await events.wait(2)
+        assert await game_state(requests, p) == "PREGAME"
+        await stub.emit(SESSION_EVENT, {"uri": f"/ares-core-game/core-game/v1/players/{PUUID}", "data": {}})
+        assert await events.wait(2)
+        assert requests.request_count == seeded
+
+        # Feed drops: back to polling until it reconnects
+        await stub.drop()
+        for _ in range(100):
+            if not events.connected:
+                break
+            await asyncio.sleep(0.01)
+        requests.state = "INGAME"
+        assert await game_state(requests, p) == "INGAME"
+        assert requests.request_count == seeded + 1
+
+        await asyncio.wait_for(stub.connected.wait(), 2)
+        assert await events.wait(2)
+        assert events.connected
+
+    asyncio.run(run_feed(test))
+
+
+def test_wrong_password_falls_back_to_polling(monkeypatch):
+    monkeypatch.setattr(presence_events, "RECONNECT_DELAY", 0.05)
+
+    async def test(stub, requests, events, p):
+        requests.lockfile["password"] = "wrong"
+        events.start()
+        await asyncio.sleep(0.2)
+        assert not events.connected
+        assert stub.subscriptions == []
+        assert await game_state(requests, p) == "MENUS"
+
+    asyncio.run(run_feed(test))
+
+
+def test_presence_delete_removes_player():
+    events = PresenceEvents(FakeRequests("x"), url="ws://unused")
+    events.presences = {"friend": presence("friend", "MENUS")}
+    message = [presence_events.WAMP_EVENT, presence_events.PRESENCE_EVENT,
+               {"data": {"presences": [presence("friend", "MENUS")]}, "eventType": "Delete"}]
+    events._handle(json.dumps(message))
+    assert events.presences == {}
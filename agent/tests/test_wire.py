@@ -0,0 +1,43 @@
+import os
+
+import pytest
+
+import wire
+
+ROOT = os.path.join(os.path.dirname(__file__), os.pardir, os.pardir)
+AGENT_WIRE = os.path.join(ROOT, "agent", "src", "wire.py")
+BACKEND_WIRE = os.path.join(ROOT, "backend", "app", "wire.py")
+
+
+def test_agent_and_backend_copies_match():
+    """Both sides must share the key dictionary and framing; only the cross-reference comment differs."""
+    with open(AGENT_WIRE, encoding="utf-8") as f:
+        agent = f.read()
+    with open(BACKEND_WIRE, encoding="utf-8") as f:
+        backend = f.read()
+    assert agent.replace("backend/app/wire.py", "<other>/wire.py") == backend.replace("agent/src/wire.py", "<other>/wire.py")
+
+
+def test_encoding_names_carry_key_dictionary_version():
+    assert all(encoding.endswith(f"/v{len(wire.KEYS)}") for encoding in wire.ENCODINGS)
+
+
+def test_roundtrip():
+    pytest.importorskip("msgpack")
+    message = {"type": "match_patch", "id": 7, "data": {"players": [{"subject": "a", "kd": 1.5}], "custom": "x"}}
+    for encoding in wire.ENCODINGS:
+        assert wire.decode(wire.encode(message, encoding)) == message
+
+
+def test_large_frames_are_compressed():
+    pytest.importorskip("msgpack")
+    message = {"type": "batch", "messages": [{"type": "match_update", "data": {"game_name": "x" * 100}}] * 20}
+    assert wire.encode(message, wire.ENCODINGS[0])[0] == wire.FLAG_ZLIB
+    assert wire.encode(message, wire.ENCODINGS[1])[0] == wire.FLAG_PLAIN
+
+
+def test_unknown_key_ids_are_kept():
+    msgpack = pytest.importorskip("msgpack")
+    unknown = len(wire.KEYS) + 3
+    frame = bytes([wire.FLAG_PLAIN]) + msgpack.packb({0: "ack", unknown: 1})
+    assert wire.decode(frame) == {"type": "ack", unknown: 1}
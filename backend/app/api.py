@@ -11,53 +11,75 @@ from .auth import verify_api_key
 
 router = APIRouter()
 
+async def create_active_match_record(session: AsyncSession, active_match: ActiveMatchCreate) -> ActiveMatch:
+    """Create an active match with its players, replacing any existing match with the same UUID"""
+    # Check if a match with this UUID already exists
+    existing_match = await session.exec(
+        select(ActiveMatch).where(ActiveMatch.match_uuid == active_match.match_uuid)
+    )
+    existing_match = existing_match.first()
+
+    if existing_match:
+        # Delete the existing match (cascade will handle players)
+        await session.delete(existing_match)
+        await session.commit()
+
+    # Create new active match (exclude players from the main model)
+    match_data = active_match.model_dump(exclude={'players'})
+    active_match_db = ActiveMatch(**match_data)
+    session.add(active_match_db)
+    await session.commit()  # Use commit instead of flush to ensure ID is available
+    await session.refresh(active_match_db)
+
+    # Create players if provided
+    if active_match.players:
+        for player_data in active_match.players:
+            player = ActiveMatchPlayer(
+                subject=player_data.subject,
+                match_id=active_match_db.id,
+                character=player_data.character,
+                team_id=player_data.team_id,
+                game_name=player_data.game_name,
+                account_level=player_data.account_level,
+                player_card_id=player_data.player_card_id,
+                player_title_id=player_data.player_title_id,
+                preferred_level_border_id=player_data.preferred_level_border_id,
+                agent_icon=player_data.agent_icon,
+                rank=player_data.rank,
+                rr=player_data.rr,
+                leaderboard_rank=player_data.leaderboard_rank,
+                kd=player_data.kd,
+                hs=player_data.hs,
+                adr=player_data.adr,
+                peak_rank=player_data.peak_rank,
+            )
+            session.add(player)
+
+        await session.commit()
+
+    return active_match_db
+
+
+async def delete_active_match_record(session: AsyncSession, match_uuid: str) -> bool:
+    """Delete an active match by UUID; False if there was none"""
+    active_match = await session.exec(
+        select(ActiveMatch).where(ActiveMatch.match_uuid == match_uuid)
+    )
+    active_match = active_match.one_or_none()
+    if not active_match:
+        return False
+    await session.delete(active_match)
+    await session.commit()
+    return True
+
+
 # Active Match Endpoints
 @router.post("/active_matches/", response_model=None, status_code=status.HTTP_201_CREATED)
 async def create_active_match(active_match: ActiveMatchCreate, api_key: str = Depends(verify_api_key)):
     async with AsyncSession(engine) as session:
-        # Check if a match with this UUID already exists
-        existing_match = await session.exec(
-            select(ActiveMatch).where(ActiveMatch.match_uuid == active_match.match_uuid)
-        )
-        existing_match = existing_match.first()
-
-        if existing_match:
-            # Delete the existing match (cascade will handle players)
-            await session.delete(existing_match)
-            await session.commit()
-
-        # Create new active match (exclude players from the main model)
-        match_data = active_match.model_dump(exclude={'players'})
-        active_match_db = ActiveMatch(**match_data)
-        session.add(active_match_db)
-        await session.commit()  # Use commit instead of flush to ensure ID is available
-        await session.refresh(active_match_db)
-
-        # Create players if provided
-        if active_match.players:
-            for player_data in active_match.players:
-                player = ActiveMatchPlayer(
-                    subject=player_data.subject,
-                    match_id=active_match_db.id,
-                    character=player_data.character,
-                    team_id=player_data.team_id,
-                    game_name=player_data.game_name,
-                    account_level=player_data.account_level,
-                    player_card_id=player_data.player_card_id,
-                    player_title_id=player_data.player_title_id,
-                    preferred_level_border_id=player_data.preferred_level_border_id,
-                    agent_icon=player_data.agent_icon,
-                    rank=player_data.rank,
-                    rr=player_data.rr,
-                    leaderboard_rank=player_data.leaderboard_rank,
-                    kd=player_data.kd,
-                    hs=player_data.hs,
-                    adr=player_data.adr,
-                    peak_rank=player_data.peak_rank,
-                )
-                session.add(player)
-
-            await session.commit()
+        await create_active_match_record(session, active_match)
+
+
 
 
 @router.get("/active_matches/", response_model=List[ActiveMatchRead])
@@ -130,12 +152,6 @@ async def delete_active_match(active_match_id: int, api_key: str = Depends(verif
 @router.delete("/active_matches/uuid/{match_id}", status_code=status.HTTP_204_NO_CONTENT, summary="Delete an active match by UUID")
 async def delete_active_match_by_uuid(match_id: str, api_key: str = Depends(verify_api_key)):
     async with AsyncSession(engine) as session:
-        active_match = await session.exec(
-            select(ActiveMatch).where(ActiveMatch.match_uuid == match_id)
-        )
-        active_match = active_match.one_or_none()
-        if not active_match:
+        if not await delete_active_match_record(session, match_id):
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Active match not found")
-        await session.delete(active_match)
-        await session.commit()
     return Response(status_code=status.HTTP_204_NO_CONTENT)
@@ -8,13 +8,16 @@ from starlette.websockets import WebSocketDisconnect
 import datetime
 
 from .database import init_db, engine
-from .api import router as api_router
-from .models import ActiveMatch
+from .api import router as api_router, create_active_match_record, delete_active_match_record
+from .models import ActiveMatch, ActiveMatchPlayer
+from .schemas import ActiveMatchCreate
 from .websocket import ConnectionManager
+from . import wire
 from .auth import api_key_auth, verify_websocket_api_key
 import time, logging
 from sqlalchemy.orm import selectinload
 from datetime import datetime, timezone
+from typing import Optional
 import json
 
 logger = logging.getLogger(__name__)
@@ -33,7 +36,7 @@ async def lifespan(app: FastAPI):
 
 
 async def update_model_from_json(model_instance, json_data: dict):
-    """Update a SQLModel instance with JSON data, only updating valid fields"""
+    """Update a SQLModel instance with JSON data, only updating valid fields whose value changed"""
 
     # Use model_fields for Pydantic v2 compatibility
     model_fields = set(model_instance.model_fields.keys())
@@ -64,7 +67,8 @@ async def update_model_from_json(model_instance, json_data: dict):
                     # Convert to timezone-naive datetime for PostgreSQL
                     value = value.replace(tzinfo=None)
 
-            setattr(model_instance, field, value)
+            if getattr(model_instance, field) != value:
+                setattr(model_instance, field, value)
 
     # Always update the last_updated field (timezone-naive)
     if hasattr(model_instance, 'last_updated'):
@@ -72,6 +76,34 @@ async def update_model_from_json(model_instance, json_data: dict):
 
     return model_instance
 
+async def receive_agent_message(websocket: WebSocket) -> dict:
+    """Receive one agent message, JSON text or a binary frame in the encoding negotiated in the hello"""
+    message = await websocket.receive()
+    if message["type"] == "websocket.disconnect":
+        raise WebSocketDisconnect(message.get("code", 1000))
+    if message.get("bytes") is not None:
+        return wire.decode(message["bytes"])
+    return json.loads(message["text"])
+
+
+async def update_players_from_json(session: AsyncSession, active_match: ActiveMatch, players: list):
+    """Apply per-player field updates, matched by subject, to the players of an active match"""
+    if not players:
+        return
+
+    result = await session.exec(
+        select(ActiveMatchPlayer).where(ActiveMatchPlayer.match_id == active_match.id)
+    )
+    match_players = {player.subject: player for player in result.all()}
+
+    for player_data in players:
+        player = match_players.get(player_data.get("subject"))
+        if player is None:
+            logger.info(f"No player {player_data.get('subject')} found in active match {active_match.match_uuid}")
+            continue
+        await update_model_from_json(player, player_data)
+        session.add(player)
+
 def create_app() -> FastAPI:
     app = FastAPI(title="Valorant Performance Tracker", lifespan=lifespan)
     router = APIRouter()
@@ -118,7 +150,162 @@ def create_app() -> FastAPI:
     # include routers
     app.include_router(api_router, prefix="/api")
 
+    async def handle_agent_message(match_uuid: str, data: dict, session_id: Optional[str] = None,
+                                   websocket: Optional[WebSocket] = None) -> bool:
+        """
+        Apply one agent message to the active match and forward it to the frontend; False if there was nothing to apply.
+        Sequence numbers are tracked per agent session, so two agents in the same match do not see each other's
+        patches as duplicates or gaps; a missed patch is requested from the connection it came over.
+        """
+        seq_key = (session_id, match_uuid)
+        msg_type = data.get("type")
+        match_data = data.get("data", None)
+
+        # If match_data is a string (JSON), parse it
+        if isinstance(match_data, str):
+            try:
+                match_data = json.loads(match_data)
+            except json.JSONDecodeError as e:
+                logger.info(f"Failed to parse match_data JSON: {e}")
+                return False
+
+        if msg_type == "match_end":
+            async with AsyncSession(engine) as session:
+                ended = await delete_active_match_record(session, match_uuid)
+            manager.agent_seqs.pop(seq_key, None)
+            await manager.broadcast(match_uuid, data)
+            logger.info(f"Ended active match {match_uuid}" if ended else f"No active match found to end for UUID: {match_uuid}")
+            return True
+
+        if not match_data:
+            logger.info("No data field found in message")
+            return False
+
+        # update the active match in the database
+        async with AsyncSession(engine) as session:
+            if msg_type == "match_create":
+                await create_active_match_record(session, ActiveMatchCreate(**match_data))
+                manager.agent_seqs[seq_key] = data.get("seq", 0)
+                logger.info(f"Created active match {match_uuid}")
+                return True
+
+            result = await session.exec(
+                select(ActiveMatch).where(ActiveMatch.match_uuid == match_uuid)
+            )
+            active_match = result.first()
+
+            # Patches must be applied in order on top of the last snapshot
+            seq = data.get("seq")
+            if msg_type == "match_patch":
+                last_seq = manager.agent_seqs.get(seq_key)
+                if last_seq is not None and seq <= last_seq:
+                    logger.info(f"Ignoring duplicate patch #{seq} for match {match_uuid}")
+                    return True
+                if last_seq is None or seq != last_seq + 1:
+                    logger.info(f"Missed patches before #{seq} for match {match_uuid}, requesting a snapshot")
+                    await manager.request_data(match_uuid, websocket)
+                    return True
+
+            if active_match:
+                # Create a copy to avoid modifying the original
+                match_data_copy = dict(match_data) if isinstance(match_data, dict) else {}
+
+                # Players are updated separately, matched by subject
+                players = match_data_copy.pop("players", [])
+
+                logger.info(f"Updating match with data: {match_data_copy}")
+
+                # Update main match fields with validation and type conversion
+                await update_model_from_json(active_match, match_data_copy)
+                await update_players_from_json(session, active_match, players)
+
+                session.add(active_match)
+                await session.commit()
+                await session.refresh(active_match)
+                logger.info(f"Successfully updated active match {match_uuid}")
+            else:
+                logger.info(f"No active match found for UUID: {match_uuid}")
+
+            if seq is not None:
+                manager.agent_seqs[seq_key] = seq
+
+        # Send the updated data to frontend clients
+        await manager.broadcast(match_uuid, data)
+        return True
+
     # websocket endpoints
+    @app.websocket("/ws/agent")
+    async def agent_session_endpoint(websocket: WebSocket, api_key: str = Query(...)):
+        """
+        Long-lived agent connection carrying create/update/end messages for any match.
+        Every message (or batch of messages) has a session-wide id and is acknowledged cumulatively with
+        {"type": "ack", "id": N}, meaning every message up to N was applied. Messages are JSON text or, if negotiated
+        in the hello, MessagePack binary frames (see wire.py). The agent opens it with a hello and gets back the last
+        id applied for its session, or the session's last sequence number per match if the id is unknown, so it can
+        resume after a reconnect. The resume state of a session is dropped once it stayed away for AGENT_SESSION_TTL.
+        """
+        # Verify API key for WebSocket connection
+        if not verify_websocket_api_key(api_key):
+            await websocket.close(code=4001, reason="Invalid API key")
+            return
+
+        await websocket.accept()
+        session_id = None
+        try:
+            while True:
+                data = await receive_agent_message(websocket)
+                logger.info(f"Received data from agent session: {data}")
+
+                if data.get("type") == "hello":
+                    session_id = data.get("session_id")
+                    manager.resume_agent_session(session_id)
+                    matches = data.get("matches", [])
+                    for match_uuid in matches:
+                        manager.attach_agent(match_uuid, websocket)
+                    supported = wire.available_encodings()
+                    await websocket.send_json({
+                        "type": "resume",
+                        "ack": manager.agent_acks.get(session_id),
+                        "matches": {match_uuid: manager.agent_seqs.get((session_id, match_uuid)) for match_uuid in matches},
+                        # First binary encoding offered by the agent that we can decode, JSON otherwise
+                        "encoding": next((e for e in data.get("encodings", []) if e in supported), "json"),
+                    })
+                    continue
+
+                message_id = data.get("id")
+                last_id = manager.agent_acks.get(session_id, 0)
+                if message_id is not None and message_id <= last_id:
+                    # Retransmission of a message we already applied
+                    await websocket.send_json({"type": "ack", "id": last_id})
+                    continue
+
+                # A batch replays the latest state of several matches after an outage, in order
+                messages = data.get("messages", []) if data.get("type") == "batch" else [data]
+                failed = False
+                for message in messages:
+                    match_uuid = message.get("match_uuid")
+                    if not match_uuid:
+                        logger.info("No match_uuid found in agent session message")
+                        failed = True
+                        continue
+                    manager.attach_agent(match_uuid, websocket)
+                    try:
+                        await handle_agent_message(match_uuid, message, session_id, websocket)
+                    except Exception as db_error:
+                        logger.error(f"Database error in agent session: {db_error}")
+                        failed = True
+
+                if message_id is not None:
+                    manager.agent_acks[session_id] = message_id
+                    await websocket.send_json({"type": "ack", "id": message_id, "error": failed})
+
+        except WebSocketDisconnect:
+            logger.info(f"Agent session {session_id} disconnected")
+        except Exception as e:
+            logger.error(f"Error in agent session: {str(e)}")
+        finally:
+            manager.detach_agent(websocket, session_id)
+
     @app.websocket("/ws/agent/{match_uuid}")
     async def agent_websocket_endpoint(websocket: WebSocket, match_uuid: str, api_key: str = Query(...)):
         # Verify API key for WebSocket connection
@@ -129,53 +316,13 @@ def create_app() -> FastAPI:
         await manager.connect_agent(match_uuid, websocket)
         try:
             while True:
-                data = await websocket.receive_json()
+                data = await receive_agent_message(websocket)
                 logger.info(f"Received data from agent for match {match_uuid}: {data}")
 
-                # update the active match in the database
                 try:
-                    async with AsyncSession(engine) as session:
-                        result = await session.exec(
-                            select(ActiveMatch).where(ActiveMatch.match_uuid == match_uuid)
-                        )
-                        active_match = result.first()
-                        match_data = data.get("data", None)
-                        if not match_data:
-                            logger.info("No data field found in message")
-                            continue
-
-                        # If match_data is a string (JSON), parse it
-                        if isinstance(match_data, str):
-                            try:
-                                match_data = json.loads(match_data)
-                            except json.JSONDecodeError as e:
-                                logger.info(f"Failed to parse match_data JSON: {e}")
-                                continue
-
-                        if active_match:
-                            # Create a copy to avoid modifying the original
-                            match_data_copy = dict(match_data) if isinstance(match_data, dict) else {}
-
-                            # Remove players from match_data since they don't change after initial creation
-                            match_data_copy.pop("players", [])
-
-                            logger.info(f"Updating match with data: {match_data_copy}")
-
-                            # Update main match fields with validation and type conversion
-                            await update_model_from_json(active_match, match_data_copy)
-
-                            session.add(active_match)
-                            await session.commit()
-                            await session.refresh(active_match)
-                            logger.info(f"Successfully updated active match {match_uuid}")
-                        else:
-                            logger.info(f"No active match found for UUID: {match_uuid}")
-
-                    # Send the updated data to frontend clients
-                    await manager.broadcast(match_uuid, data)
-
-                    # Send acknowledgment back to agent
-                    await websocket.send_text("ACK")
+                    if await handle_agent_message(match_uuid, data):
+                        # Send acknowledgment back to agent
+                        await websocket.send_text("ACK")
 
                 except Exception as db_error:
                     logger.error(f"Database error in agent websocket: {db_error}")
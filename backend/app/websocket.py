@@ -1,12 +1,22 @@
 import logging
-from typing import Dict, List
+import time
+from typing import Dict, List, Optional, Tuple
 from fastapi import WebSocket
 from .cleanup_service import cleanup_service
 
+# Seconds the resume state (last ack and sequence numbers) of a disconnected agent session is kept
+AGENT_SESSION_TTL = 60 * 60
+
 class ConnectionManager:
     def __init__(self):
         self.live_conns: Dict[str, List[WebSocket]] = {}
         self.agent_conns: Dict[str, WebSocket] = {}
+        # Sequence number of the last agent message applied per (agent session, match)
+        self.agent_seqs: Dict[Tuple[Optional[str], str], int] = {}
+        # Id of the last message applied per agent session
+        self.agent_acks: Dict[str, int] = {}
+        # When each disconnected agent session went away
+        self.agent_left: Dict[Optional[str], float] = {}
 
     async def connect_agent(self, agent_id: str, ws: WebSocket):
         await ws.accept()
@@ -25,9 +35,40 @@ class ConnectionManager:
 
     def disconnect_agent(self, match_uuid: str):
         self.agent_conns.pop(match_uuid, None)
+        self.agent_seqs.pop((None, match_uuid), None)
+
+    def attach_agent(self, match_uuid: str, ws: WebSocket):
+        """Route requests for a match to an agent session connection that carries it"""
+        self.agent_conns[match_uuid] = ws
+
+    def detach_agent(self, ws: WebSocket, session_id: Optional[str] = None):
+        """Forget an agent session connection; its acks and sequence numbers are kept so the agent can resume"""
+        for match_uuid in [uuid for uuid, conn in self.agent_conns.items() if conn is ws]:
+            del self.agent_conns[match_uuid]
+        if session_id is not None:
+            self.agent_left[session_id] = time.monotonic()
+        self.prune_agent_sessions()
+
+    def resume_agent_session(self, session_id: Optional[str]):
+        """An agent session (re)connected; its resume state is in use again"""
+        self.agent_left.pop(session_id, None)
+        self.prune_agent_sessions()
+
+    def prune_agent_sessions(self):
+        """Drop the resume state of agent sessions that stayed disconnected for longer than AGENT_SESSION_TTL"""
+        cutoff = time.monotonic() - AGENT_SESSION_TTL
+        expired = {session_id for session_id, left in self.agent_left.items() if left < cutoff}
+        if not expired:
+            return
+        for session_id in expired:
+            del self.agent_left[session_id]
+            self.agent_acks.pop(session_id, None)
+        for key in [key for key in self.agent_seqs if key[0] in expired]:
+            del self.agent_seqs[key]
 
-    async def request_data(self, match_uuid: str):
-        ws = self.agent_conns.get(match_uuid)
+    async def request_data(self, match_uuid: str, ws: Optional[WebSocket] = None):
+        """Ask an agent for a full snapshot of a match, over the given connection or the last one that carried it"""
+        ws = ws or self.agent_conns.get(match_uuid)
         logging.getLogger(__name__).error(f"Requesting data for match {match_uuid} from agent connection: {ws}")
 
         if not ws:
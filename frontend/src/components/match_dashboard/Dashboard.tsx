@@ -43,7 +43,7 @@ export interface MatchData {
 }
 
 // Types for live events
-export type LiveEventType = "match_update" | "match_end" | "initial_data";
+export type LiveEventType = "match_update" | "match_end" | "initial_data" | "match_patch";
 
 export interface LiveEvent {
     type: LiveEventType;
@@ -121,14 +121,21 @@ export const LiveDashboard: React.FC = () => {
                                 const currentMatch = eventData.data as CurrentMatch;
                                 console.log("Initial player data:", initialPlayerDataRef.current);
 
-                                // Use ref data if available
-                                if (initialPlayerDataRef.current && initialPlayerDataRef.current.length > 0) {
+                                // Full snapshots carry the roster, otherwise use ref data if available
+                                if (currentMatch.players && currentMatch.players.length > 0) {
+                                    initialPlayerDataRef.current = currentMatch.players;
+                                } else if (initialPlayerDataRef.current && initialPlayerDataRef.current.length > 0) {
                                     currentMatch.players = initialPlayerDataRef.current;
                                 }
-                                if (initialPartyOwnerAverageRankRef.current) {
+                                // Average ranks arrive in a later update when players are enriched progressively
+                                if (currentMatch.party_owner_average_rank) {
+                                    initialPartyOwnerAverageRankRef.current = currentMatch.party_owner_average_rank;
+                                } else if (initialPartyOwnerAverageRankRef.current) {
                                     currentMatch.party_owner_average_rank = initialPartyOwnerAverageRankRef.current;
                                 }
-                                if (initialPartyOwnerEnemyAverageRankRef.current) {
+                                if (currentMatch.party_owner_enemy_average_rank) {
+                                    initialPartyOwnerEnemyAverageRankRef.current = currentMatch.party_owner_enemy_average_rank;
+                                } else if (initialPartyOwnerEnemyAverageRankRef.current) {
                                     currentMatch.party_owner_enemy_average_rank = initialPartyOwnerEnemyAverageRankRef.current;
                                 }
                                 if (initialPartyOwnerTeamIdRef.current) {
@@ -141,6 +148,32 @@ export const LiveDashboard: React.FC = () => {
                         });
                         break;
                     }
+                    case "match_patch": {
+                        // Only the fields that changed, players are matched by subject
+                        const {players: playerPatches = [], ...fields} = eventData.data as unknown as
+                            Partial<Omit<CurrentMatch, "players">> & { players?: (Partial<CurrentMatchPlayer> & { subject: string })[] };
+                        const patchPlayers = (players: CurrentMatchPlayer[]) => players.map((player) => {
+                            const patch = playerPatches.find((p) => p.subject === player.subject);
+                            return patch ? {...player, ...patch} : player;
+                        });
+                        if (initialPlayerDataRef.current) {
+                            initialPlayerDataRef.current = patchPlayers(initialPlayerDataRef.current);
+                        }
+                        if (fields.party_owner_average_rank) {
+                            initialPartyOwnerAverageRankRef.current = fields.party_owner_average_rank;
+                        }
+                        if (fields.party_owner_enemy_average_rank) {
+                            initialPartyOwnerEnemyAverageRankRef.current = fields.party_owner_enemy_average_rank;
+                        }
+                        setMatchData((previous) => previous && {
+                            match: {
+                                ...previous.match,
+                                ...fields,
+                                players: patchPlayers(previous.match.players)
+                            }
+                        });
+                        break;
+                    }
                     case "match_end":
                         setMatchData(undefined);
                         initialPlayerDataRef.current = null;